@@ -0,0 +1,692 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Benchmarks MCModManager against a local stand-in for the parts of the Modrinth v2 and
+# CurseForge v1 APIs that mcmm.py uses. Every pack size gets its own synthetic set of mods,
+# and each operation is measured for wall time, requests, bytes transferred and peak memory.
+#
+#   python benchmark.py --sizes 10,100,1000 --latency 20 --fail-rate 0.01
+#
+# The mock server runs in a separate process, so its memory use and threads don't show up in
+# the measurements of mcmm.py.
+
+# The pack starts on the first version and is checked and updated to the second one. The
+# newest version is listed first, like the real APIs do.
+game_versions = ["1.21", "1.20.4", "1.20.1"]
+server_version = "1.20.1"
+target_version = "1.20.4"
+
+operations = ["add", "check", "update", "import"]
+
+# Commands that only read local files, which health checks call many times a day. They must
+# start within the budget and must not load the modules mcmm.py only imports when it needs them.
+startup_commands = [["-h"], ["-v"], ["-l"]]
+lazy_modules = ["requests", "hashlib", "sqlite3", "datetime", "concurrent.futures"]
+
+
+def jar_contents(filename, size):
+    block = hashlib.sha256(filename.encode()).digest()
+    return (block * (size // len(block) + 1))[:size]
+
+
+def generate_pack(mods, curseforge_share, jar_size, files_url):
+    # Build the synthetic mods. Every mod has a release for each Minecraft version, except for
+    # every 20th mod which never got one for the target version. Every 10th mod requires mod 0.
+    modrinth_projects = {}
+    modrinth_versions = {}
+    curseforge_mods = {}
+    curseforge_files = {}
+    files = {}
+
+    def add_file(filename):
+        contents = jar_contents(filename, jar_size)
+        files[filename] = len(contents)
+        return {
+            "sha1": hashlib.sha1(contents).hexdigest(),
+            "sha512": hashlib.sha512(contents).hexdigest(),
+            "md5": hashlib.md5(contents).hexdigest(),
+            "size": len(contents)
+        }
+
+    curseforge_count = int(mods * curseforge_share)
+    for i in range(mods - curseforge_count):
+        project_id = f"P{i:07d}"
+        versions = []
+        for game_version in game_versions:
+            if i % 20 == 19 and game_version == target_version:
+                continue
+            filename = f"mod-{i}-{game_version}.jar"
+            hashes = add_file(filename)
+            mod_version = {
+                "id": f"V{i:07d}{game_versions.index(game_version)}",
+                "project_id": project_id,
+                "name": f"Mod {i} for {game_version}",
+                "game_versions": [game_version],
+                "loaders": ["fabric"],
+                "dependencies": [{"project_id": "P0000000", "version_id": None, "dependency_type": "required"}]
+                if i % 10 == 9 else [],
+                "files": [{
+                    "filename": filename,
+                    "url": f"{files_url}/files/{filename}",
+                    "size": hashes["size"],
+                    "primary": True,
+                    "hashes": {"sha1": hashes["sha1"], "sha512": hashes["sha512"]}
+                }]
+            }
+            versions.append(mod_version)
+            modrinth_versions[mod_version["id"]] = mod_version
+        modrinth_projects[project_id] = {
+            "id": project_id,
+            "slug": f"mod-{i}",
+            "title": f"Mod {i}",
+            "game_versions": sorted({v["game_versions"][0] for v in versions}),
+            "loaders": ["fabric"],
+            "versions": [v["id"] for v in versions],
+            "_versions": versions
+        }
+
+    for i in range(curseforge_count):
+        mod_id = 100000 + i
+        mod_files = []
+        for game_version in game_versions:
+            if i % 20 == 19 and game_version == target_version:
+                continue
+            filename = f"cf-{i}-{game_version}.jar"
+            hashes = add_file(filename)
+            file = {
+                "id": mod_id * 10 + game_versions.index(game_version),
+                "modId": mod_id,
+                "fileName": filename,
+                "downloadUrl": f"{files_url}/files/{filename}",
+                "fileLength": hashes["size"],
+                "gameVersions": [game_version, "Fabric"],
+                "dependencies": [{"modId": 100000, "relationType": 3}] if i % 10 == 9 else [],
+                "hashes": [{"value": hashes["sha1"], "algo": 1}, {"value": hashes["md5"], "algo": 2}]
+            }
+            mod_files.append(file)
+            curseforge_files[file["id"]] = file
+        curseforge_mods[mod_id] = {
+            "id": mod_id,
+            "name": f"CF Mod {i}",
+            "slug": f"cf-mod-{i}",
+            "latestFilesIndexes": [{"gameVersion": f["gameVersions"][0], "fileId": f["id"],
+                                    "filename": f["fileName"], "modLoader": 4} for f in mod_files],
+            "_files": mod_files
+        }
+
+    versions_by_hash = {mod_version["files"][0]["hashes"]["sha1"]: mod_version
+                        for mod_version in modrinth_versions.values()}
+
+    return {
+        "modrinth_projects": modrinth_projects,
+        "modrinth_slugs": {project["slug"]: project for project in modrinth_projects.values()},
+        "modrinth_versions": modrinth_versions,
+        "versions_by_hash": versions_by_hash,
+        "curseforge_mods": curseforge_mods,
+        "curseforge_files": curseforge_files,
+        "files": files,
+        "jar_size": jar_size
+    }
+
+
+def public(data):
+    return {key: value for key, value in data.items() if not key.startswith("_")}
+
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+
+    # Answers the Modrinth and CurseForge endpoints used by mcmm.py from the synthetic pack,
+    # and counts every request and byte so the benchmark can ask for the totals.
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data, headers=None):
+        self.send_body(status, json.dumps(data).encode(), "application/json", headers)
+
+    def send_body(self, status, body, content_type="application/octet-stream", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count("bytes_sent", len(body))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw_body = self.rfile.read(length)
+        self.server.count("bytes_received", length)
+        try:
+            self.body = json.loads(raw_body or b"null")
+        except ValueError:
+            return self.send_json(400, {"error": "invalid json"})
+        self.handle_request()
+
+    def do_GET(self):
+        self.body = None
+        self.handle_request()
+
+    def handle_request(self):
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path
+        query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+
+        if path == "/_stats":
+            return self.send_json(200, self.server.get_stats())
+        if path == "/_reset":
+            self.server.reset_stats()
+            return self.send_json(200, {})
+
+        endpoint = self.get_endpoint_name(path)
+        self.server.count("requests")
+        self.server.count_endpoint(f"{self.command} {endpoint}")
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.fail_rate and random.random() < self.server.fail_rate:
+            self.server.count("failures")
+            return self.send_json(503, {"error": "injected failure"})
+
+        # Downloads come from a CDN in the real world, so only API requests are rate limited
+        headers = {}
+        if not path.startswith("/files/") and self.server.rate_limit:
+            allowed, headers = self.server.take_rate_limit_token()
+            if not allowed:
+                self.server.count("rate_limited")
+                headers["Retry-After"] = headers["X-Ratelimit-Reset"]
+                return self.send_json(429, {"error": "ratelimited"}, headers)
+
+        try:
+            status, data = self.route(path, query)
+        except (KeyError, ValueError, TypeError):
+            status, data = 400, {"error": "bad request"}
+
+        if status is None:
+            # The response was already sent
+            return
+        if isinstance(data, bytes):
+            return self.send_body(status, data, headers=headers)
+        self.send_json(status, data, headers)
+
+    def get_endpoint_name(self, path):
+        # Collapse IDs, slugs, hashes and filenames so requests group by endpoint
+        parts = path.split("/")
+        if path.startswith("/files/"):
+            return "/files/{file}"
+        if path.startswith("/modrinth/v2/project/"):
+            parts[4] = "{id}"
+        elif path.startswith("/modrinth/v2/version_file/"):
+            parts[4] = "{hash}"
+        elif path.startswith("/curseforge/v1/mods/") and len(parts) > 4 and parts[4].isdigit():
+            parts[4] = "{id}"
+        return "/".join(parts)
+
+    def route(self, path, query):
+        pack = self.server.pack
+
+        if path.startswith("/files/"):
+            filename = path[len("/files/"):]
+            if filename not in pack["files"]:
+                return 404, {"error": "not found"}
+            contents = jar_contents(filename, pack["jar_size"])
+            byte_range = self.headers.get("Range")
+            if byte_range and byte_range.startswith("bytes="):
+                start = int(byte_range[len("bytes="):].split("-")[0])
+                self.send_body(206, contents[start:], headers={
+                    "Content-Range": f"bytes {start}-{len(contents) - 1}/{len(contents)}"})
+                return None, None
+            return 200, contents
+
+        if path.startswith("/modrinth/v2/"):
+            return self.route_modrinth(path[len("/modrinth/v2"):], query, pack)
+        if path.startswith("/curseforge/v1/"):
+            return self.route_curseforge(path[len("/curseforge/v1"):], query, pack)
+        return 404, {"error": "not found"}
+
+    def route_modrinth(self, endpoint, query, pack):
+        parts = endpoint.strip("/").split("/")
+
+        if endpoint == "/tag/game_version":
+            return 200, [{"version": v, "version_type": "release"} for v in game_versions]
+
+        if parts[0] == "project" and len(parts) in (2, 3):
+            project = pack["modrinth_projects"].get(parts[1]) or pack["modrinth_slugs"].get(parts[1])
+            if not project:
+                return 404, {"error": "not found"}
+            if len(parts) == 2:
+                return 200, public(project)
+            versions = project["_versions"]
+            if "game_versions" in query:
+                wanted = set(json.loads(query["game_versions"]))
+                versions = [v for v in versions if wanted & set(v["game_versions"])]
+            if "loaders" in query:
+                wanted = set(json.loads(query["loaders"]))
+                versions = [v for v in versions if wanted & set(v["loaders"])]
+            return 200, versions
+
+        if endpoint == "/projects":
+            ids = json.loads(query["ids"])
+            projects = [pack["modrinth_projects"].get(i) or pack["modrinth_slugs"].get(i) for i in ids]
+            return 200, [public(project) for project in projects if project]
+
+        if endpoint == "/versions":
+            ids = json.loads(query["ids"])
+            return 200, [pack["modrinth_versions"][i] for i in ids if i in pack["modrinth_versions"]]
+
+        if parts[0] == "version_file" and len(parts) == 2:
+            mod_version = pack["versions_by_hash"].get(parts[1])
+            return (200, mod_version) if mod_version else (404, {"error": "not found"})
+
+        if endpoint == "/version_files":
+            return 200, {h: pack["versions_by_hash"][h] for h in self.body["hashes"] if h in pack["versions_by_hash"]}
+
+        if endpoint == "/version_files/update":
+            wanted_versions = set(self.body.get("game_versions", game_versions))
+            wanted_loaders = set(self.body.get("loaders", ["fabric"]))
+            newest_versions = {}
+            for h in self.body["hashes"]:
+                if h not in pack["versions_by_hash"]:
+                    continue
+                project = pack["modrinth_projects"][pack["versions_by_hash"][h]["project_id"]]
+                for mod_version in project["_versions"]:
+                    if wanted_versions & set(mod_version["game_versions"]) and wanted_loaders & set(mod_version["loaders"]):
+                        newest_versions[h] = mod_version
+                        break
+            return 200, newest_versions
+
+        return 404, {"error": "not found"}
+
+    def route_curseforge(self, endpoint, query, pack):
+        parts = endpoint.strip("/").split("/")
+
+        if endpoint == "/mods":
+            return 200, {"data": [public(pack["curseforge_mods"][i]) for i in self.body["modIds"]
+                                  if i in pack["curseforge_mods"]]}
+
+        if endpoint == "/mods/files":
+            return 200, {"data": [pack["curseforge_files"][i] for i in self.body["fileIds"]
+                                  if i in pack["curseforge_files"]]}
+
+        if parts[0] == "mods" and len(parts) in (2, 3) and parts[1].isdigit():
+            mod = pack["curseforge_mods"].get(int(parts[1]))
+            if not mod:
+                return 404, {"error": "not found"}
+            if len(parts) == 2:
+                return 200, {"data": public(mod)}
+            files = mod["_files"]
+            if "gameVersion" in query:
+                files = [f for f in files if query["gameVersion"] in f["gameVersions"]]
+            index = int(query.get("index", 0))
+            page_size = int(query.get("pageSize", 50))
+            page = files[index:index + page_size]
+            return 200, {"data": page, "pagination": {
+                "index": index, "pageSize": page_size, "resultCount": len(page), "totalCount": len(files)}}
+
+        return 404, {"error": "not found"}
+
+
+class MockAPIServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, latency, rate_limit, rate_window, fail_rate):
+        super().__init__(address, MockAPIHandler)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.fail_rate = fail_rate
+        self.pack = None
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+        self.reset_stats()
+
+    def handle_error(self, request, client_address):
+        # Clients dropping kept-alive connections is expected and not worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"requests": 0, "bytes_sent": 0, "bytes_received": 0,
+                          "failures": 0, "rate_limited": 0, "endpoints": {}}
+
+    def get_stats(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def count_endpoint(self, endpoint):
+        with self.lock:
+            self.stats["endpoints"][endpoint] = self.stats["endpoints"].get(endpoint, 0) + 1
+
+    def take_rate_limit_token(self):
+        # Fixed window limit with the same headers Modrinth sends
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= self.rate_window:
+                self.window_start = now
+                self.window_requests = 0
+            allowed = self.window_requests < self.rate_limit
+            if allowed:
+                self.window_requests += 1
+            reset = max(0.0, self.rate_window - (now - self.window_start))
+            return allowed, {
+                "X-Ratelimit-Limit": str(self.rate_limit),
+                "X-Ratelimit-Remaining": str(self.rate_limit - self.window_requests),
+                "X-Ratelimit-Reset": f"{reset:.2f}"
+            }
+
+
+def serve(args):
+    server = MockAPIServer(("127.0.0.1", args.port), args.latency / 1000, args.rate_limit,
+                           args.rate_window, args.fail_rate)
+    # Mod files are served under a different host name, like the real CDNs, so mcmm.py doesn't
+    # count downloads against the API rate limit
+    files_url = f"http://localhost:{server.server_port}"
+    server.pack = generate_pack(args.mods, args.curseforge_share, args.jar_size, files_url)
+
+    # Tell the benchmark which port was picked once the pack is ready
+    print(server.server_port, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def start_server(args, mods):
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--port", "0",
+               "--mods", str(mods), "--curseforge-share", str(args.curseforge_share),
+               "--jar-size", str(args.jar_size), "--latency", str(args.latency),
+               "--rate-limit", str(args.rate_limit), "--rate-window", str(args.rate_window),
+               "--fail-rate", str(args.fail_rate)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    port = process.stdout.readline().strip()
+    if not port:
+        process.kill()
+        sys.exit("[ERROR]: The mock server did not start")
+    return process, f"http://127.0.0.1:{port}"
+
+
+def server_call(base_url, endpoint):
+    with urllib.request.urlopen(base_url + endpoint) as response:
+        return json.load(response)
+
+
+def reset_mcmm(mcmm, base_url, cache_dir, args):
+    # Start every pack from a clean slate, as if mcmm.py had just been started
+    mcmm.modrinth_api_url = base_url + "/modrinth/v2"
+    mcmm.curseforge_api_url = base_url + "/curseforge"
+    mcmm.debug_mode = False
+    mcmm.jobs = args.jobs
+    mcmm.cache_enabled = args.cache
+    mcmm.cache_dir = cache_dir
+    mcmm.store_dir = None
+    mcmm.offline_mode = False
+    mcmm.update_check_enabled = False
+    mcmm.http_session = None
+    mcmm.rate_limiters = {}
+    mcmm.game_versions = None
+    mcmm.hash_index = None
+    mcmm.dependency_graph = None
+    mcmm.curseforge_api_key = "benchmark"
+
+
+def run_operation(mcmm, operation, mods, curseforge_share):
+    if operation == "add":
+        curseforge_count = int(mods * curseforge_share)
+        modrinth_slugs = [f"mod-{i}" for i in range(mods - curseforge_count)]
+        curseforge_ids = [str(100000 + i) for i in range(curseforge_count)]
+        if modrinth_slugs:
+            mcmm.add_mod("modrinth", ",".join(modrinth_slugs))
+        if curseforge_ids:
+            mcmm.add_mod("curseforge", ",".join(curseforge_ids))
+    elif operation == "check":
+        mcmm.check_updates(target_version)
+    elif operation == "update":
+        # Agree to remove the mods that have no release for the target version
+        sys.stdin = io.StringIO("yes\n")
+        try:
+            mcmm.update_mods(target_version)
+        finally:
+            sys.stdin = sys.__stdin__
+    elif operation == "import":
+        # Forget every mod and the hashes of their files, then import them from the mods folder
+        with open("mcmm.json", "w") as file:
+            json.dump({"mods": [], "server_version": target_version, "curseforge_api_key": "benchmark"}, file)
+        if os.path.exists(mcmm.hash_index_path):
+            os.remove(mcmm.hash_index_path)
+        mcmm.hash_index = None
+        mcmm.load_manifest()
+        mcmm.import_mods()
+
+
+def measure(mcmm, operation, mods, curseforge_share, base_url, trace_memory):
+    server_call(base_url, "/_reset")
+    error = None
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            run_operation(mcmm, operation, mods, curseforge_share)
+    except SystemExit as e:
+        error = f"exited ({e.code})"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    wall_time = time.perf_counter() - start
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    stats = server_call(base_url, "/_stats")
+    return {
+        "mods": mods,
+        "operation": operation,
+        "wall_time": wall_time,
+        "requests": stats["requests"],
+        "bytes": stats["bytes_sent"] + stats["bytes_received"],
+        "failures": stats["failures"],
+        "rate_limited": stats["rate_limited"],
+        "peak_memory": peak_memory,
+        "endpoints": stats["endpoints"],
+        "error": error
+    }
+
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def print_result(result):
+    peak_memory = format_size(result["peak_memory"]) if result["peak_memory"] is not None else "-"
+    print(f"{result['mods']:>6}  {result['operation']:<7} {result['wall_time']:>9.2f}s {result['requests']:>9} "
+          f"{format_size(result['bytes']):>11} {peak_memory:>11} {result['failures'] + result['rate_limited']:>8}"
+          + (f"  {result['error']}" if result["error"] else ""), flush=True)
+
+
+def run_benchmark(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import mcmm
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    selected_operations = args.operations.split(",")
+    for operation in selected_operations:
+        if operation not in operations:
+            sys.exit(f"[ERROR]: Unknown operation {operation}. Pick from {','.join(operations)}")
+
+    results = []
+    original_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="mcmm-benchmark-")
+
+    print(f"{'mods':>6}  {'op':<7} {'wall':>10} {'requests':>9} {'bytes':>11} {'peak mem':>11} {'retried':>8}")
+    try:
+        for mods in sizes:
+            server, base_url = start_server(args, mods)
+            try:
+                pack_dir = os.path.join(work_dir, str(mods))
+                os.makedirs(os.path.join(pack_dir, "mods"))
+                os.chdir(pack_dir)
+                with open("mcmm.json", "w") as file:
+                    json.dump({"mods": [], "server_version": server_version, "curseforge_api_key": "benchmark"}, file)
+
+                reset_mcmm(mcmm, base_url, os.path.join(pack_dir, "cache"), args)
+                mcmm.load_manifest()
+
+                for operation in selected_operations:
+                    result = measure(mcmm, operation, mods, args.curseforge_share, base_url, not args.no_memory)
+                    results.append(result)
+                    print_result(result)
+            finally:
+                os.chdir(original_dir)
+                server.terminate()
+                server.wait()
+    finally:
+        if args.keep:
+            print(f"Benchmark files kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+def time_command(command, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def get_loaded_lazy_modules(mcmm_path, arguments):
+    code = ("import json, runpy, sys\n"
+            f"sys.argv = [{mcmm_path!r}] + {arguments!r}\n"
+            "try:\n"
+            f"    runpy.run_path({mcmm_path!r}, run_name='__main__')\n"
+            "finally:\n"
+            f"    sys.stderr.write(json.dumps([m for m in {lazy_modules!r} if m in sys.modules]))\n")
+    result = subprocess.run([sys.executable, "-c", code], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return json.loads(result.stderr.strip().splitlines()[-1])
+
+
+def run_startup_benchmark(args):
+    # Time the local-only commands against a bare interpreter start, so the budget only covers
+    # what mcmm.py itself adds
+    mcmm_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mcmm.py")
+    work_dir = tempfile.mkdtemp(prefix="mcmm-startup-")
+    original_dir = os.getcwd()
+    over_budget = False
+
+    try:
+        os.chdir(work_dir)
+        mods = [{"mod_name": f"Mod {i}", "mod_slug": f"mod-{i}", "mod_id": f"P{i:07d}", "mod_version_id": f"V{i:07d}",
+                 "filename": f"mod-{i}.jar", "download_url": f"https://example.com/mod-{i}.jar",
+                 "hashes": {"sha1": "0" * 40}, "current_version": server_version, "source": "modrinth"}
+                for i in range(args.startup_mods)]
+        with open("mcmm.json", "w") as file:
+            json.dump({"mods": mods, "server_version": server_version}, file, indent=4)
+
+        baseline = time_command([sys.executable, "-c", "pass"], args.startup_runs)
+        print(f"interpreter      {baseline * 1000:8.1f} ms")
+
+        # Running mcmm.py as a script compiles it on every start, so the budget is checked against
+        # "python -m mcmm", which reuses the bytecode cached in __pycache__
+        os.environ["PYTHONPATH"] = os.path.dirname(mcmm_path)
+        subprocess.run([sys.executable, "-c", "import mcmm"], check=True)
+        for name, command, budgeted in (("mcmm.py", [sys.executable, mcmm_path], False),
+                                        ("-m mcmm", [sys.executable, "-m", "mcmm"], True)):
+            for arguments in startup_commands:
+                median = time_command(command + arguments, args.startup_runs)
+                overhead = (median - baseline) * 1000
+                problems = []
+                if budgeted and overhead > args.startup_budget:
+                    problems.append(f"over the {args.startup_budget:g} ms budget")
+                loaded = get_loaded_lazy_modules(mcmm_path, arguments)
+                if loaded:
+                    problems.append("imported " + ", ".join(loaded))
+                over_budget = over_budget or bool(problems)
+                status = "; ".join(problems) if problems else "ok" if budgeted else ""
+                print(f"{name} {' '.join(arguments):<8} {median * 1000:8.1f} ms  ({overhead:+.1f} ms)  {status}".rstrip(),
+                      flush=True)
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if over_budget:
+        sys.exit(1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark MCModManager against a local mock of the Modrinth and CurseForge APIs.")
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma-separated pack sizes. (Default: 10,100,1000)")
+    parser.add_argument("--operations", default=",".join(operations),
+                        help=f"Comma-separated operations to run, in order. (Default: {','.join(operations)})")
+    parser.add_argument("--curseforge-share", type=float, default=0.2,
+                        help="Share of the mods that come from CurseForge. (Default: 0.2)")
+    parser.add_argument("--jar-size", type=int, default=16 * 1024, help="Size of every mod file in bytes. (Default: 16384)")
+    parser.add_argument("--latency", type=float, default=0, help="Milliseconds added to every response. (Default: 0)")
+    parser.add_argument("--rate-limit", type=int, default=0,
+                        help="API requests allowed per window, 0 for no limit. (Default: 0)")
+    parser.add_argument("--rate-window", type=float, default=60, help="Length of the rate limit window in seconds. mcmm.py assumes Modrinth's 60 second window. (Default: 60)")
+    parser.add_argument("--fail-rate", type=float, default=0,
+                        help="Share of requests that fail with HTTP 503. (Default: 0)")
+    parser.add_argument("--jobs", type=int, default=8, help="Value of mcmm.py's --jobs. (Default: 8)")
+    parser.add_argument("--cache", action="store_true", help="Use mcmm.py's response cache. Off by default so every run is cold.")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Don't trace memory. tracemalloc slows Python down, so use this for clean wall times.")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results to FILE as JSON.")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated servers instead of deleting them.")
+    parser.add_argument("--startup", action="store_true",
+                        help="Time how long the local-only commands (-h, -v, -l) take to start instead, and fail if they go over the budget.")
+    parser.add_argument("--startup-budget", type=float, default=50,
+                        help="Milliseconds a local-only command may add to a bare interpreter start. (Default: 50)")
+    parser.add_argument("--startup-runs", type=int, default=20, help="Runs per command for --startup. (Default: 20)")
+    parser.add_argument("--startup-mods", type=int, default=200, help="Mods in the manifest used for --startup. (Default: 200)")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--mods", type=int, default=100, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.serve:
+        serve(args)
+    elif args.startup:
+        run_startup_benchmark(args)
+    else:
+        run_benchmark(args)
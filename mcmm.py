@@ -1,69 +1,1015 @@
 import argparse
-import hashlib
+import atexit
+import bisect
 import json
+import mmap
 import os
-import requests
+import random
+import shutil
 import sys
-import datetime
+import functools
+import threading
+import time
+import urllib.parse
+
+# requests, hashlib, sqlite3 and concurrent.futures are imported by the functions that use
+# them, so commands that never go online, hash a file or open the database (like -h, -l and
+# -v) start faster
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where the manifest is used without a lock
+    fcntl = None
 
 
 version = 'v240327'
 
+# Maximum number of mods that are checked against the APIs or downloaded at the same time
+jobs = 8
+
+# Maximum number of file hashes sent to the Modrinth bulk endpoints in one request
+modrinth_batch_size = 500
+
+# Maximum number of project IDs passed in the query string of one Modrinth request
+modrinth_ids_batch_size = 100
+
+# Worker threads share the console, so messages are printed one at a time
+message_lock = threading.Lock()
+
+# Mod files are streamed and written to disk in 1 MiB blocks
+download_chunk_size = 1024 * 1024
+
+# Updates are downloaded into a staging folder that is swapped with the mods folder in one
+# step once everything is in place. The old folder is kept as a backup until the swap is done.
+mods_staging_dir = "mods.staging"
+mods_backup_dir = "mods.old"
+
+# The hashes of the files in the mods folder are kept in an index next to mcmm.json, so files
+# are only hashed again after they change
+hash_index_path = "mcmm.hashes.json"
+hash_index = None
+
+# The manifest can be kept in an SQLite database instead of mcmm.json. The database is used
+# whenever it exists, and is created from mcmm.json with --migrate-sqlite.
+manifest_db_path = "mcmm.db"
+manifest = None
+
+# The lockfile pins the exact file of every mod, so the mods folder can be rebuilt from it
+# without asking the APIs anything
+lockfile_path = "mcmm.lock"
+
+# Required dependencies of added and updated mods are installed automatically. The dependencies
+# of each mod version are cached on disk in a dependency graph that is reused between runs.
+install_dependencies = True
+dependency_graph = None
+
+# In watch mode each mod is checked once per interval, with the checks spread over the interval.
+# The results are written to a status file next to mcmm.json.
+watch_interval = 60 * 60
+watch_poll_interval = 60
+watch_status_path = "mcmm.status.json"
+
+# A local copy of the Modrinth catalog of Fabric mods, kept in an SQLite full-text index in the
+# cache directory, is used for offline search and "did you mean" suggestions. Syncs only fetch
+# the mods that changed since the last one, except for a full sync once a week that also drops
+# mods that were removed from Modrinth.
+catalog_filename = "catalog.db"
+catalog = None
+catalog_page_size = 100
+catalog_full_sync_interval = 7 * 24 * 60 * 60
+
+# Interrupted downloads are resumed this many times before giving up
+download_retries = 3
+
+# Base URLs of the APIs. They can be pointed somewhere else, like the mock server used by
+# benchmark.py.
+modrinth_api_url = os.environ.get("MCMM_MODRINTH_URL", "https://api.modrinth.com/v2")
+curseforge_api_url = os.environ.get("MCMM_CURSEFORGE_URL", "https://api.curseforge.com")
+
+# --profile records how long each phase of a command takes, the latency of every API request
+# by endpoint and counters for the cache, retries, downloads and hashing, and writes them to a
+# JSON report at the end. Nothing is recorded unless a report was asked for.
+profile_path = None
+profile_trace_path = None
+profile_started_at = None
+profile_lock = threading.Lock()
+profile_phases = {}
+profile_requests = {}
+profile_counters = {}
+profile_latency_buckets = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+profile_endpoint_words = {"v1", "v2", "project", "projects", "version", "versions", "version_file",
+                          "version_files", "update", "tag", "game_version", "mods", "files",
+                          "search", "repos", "releases", "latest"}
+
+# Every request goes through one shared session, so connections to each host are kept alive
+# and reused. The pool holds at least as many connections per host as there are jobs.
+http_session = None
+http_session_lock = threading.Lock()
+http_timeout = 30
+http_pool_size = 16
+
+# Requests to each API host are paced by a token bucket that adjusts itself to the
+# X-Ratelimit-* headers sent back by the API. Rate limited (429) and server error (5xx)
+# responses are retried with jittered exponential backoff.
+api_rate_limits = {"api.modrinth.com": 300}
+api_rate_limit_window = 60
+api_retries = 5
+api_backoff_base = 0.5
+api_backoff_max = 30
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+# API responses are cached on disk and shared by every server on the host. Entries are kept
+# in least recently used order and pruned once the cache grows past cache_max_size.
+cache_enabled = True
+cache_dir = os.environ.get("MCMM_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "mcmm")
+cache_max_size = 64 * 1024 * 1024
+cache_prune_registered = False
+
+# How many seconds a cached response stays fresh, by endpoint. The first match is used.
+# Stale responses are revalidated with the ETag / Last-Modified headers they were sent with.
+cache_ttls = [
+    ("/version_files/update", 10 * 60),
+    ("/version_file", 24 * 60 * 60),
+    ("/tag/", 24 * 60 * 60),
+    ("/version", 10 * 60),
+    ("/files", 10 * 60),
+    ("/project", 60 * 60),
+    ("/v1/mods", 60 * 60),
+]
+cache_default_ttl = 10 * 60
+
+# Watch mode caps every TTL at half the watch interval, so each check of a mod revalidates
+# its cached responses instead of reusing them without asking
+cache_max_ttl = None
+
+# The list of valid Minecraft versions is kept in memory as a set and cached on disk, and is
+# only refreshed from Modrinth once a day. In offline mode the cached list is always used.
+game_versions = None
+game_versions_refresh_interval = 24 * 60 * 60
+offline_mode = False
+
+# The check for new releases of MCModManager runs in the background and its result is cached
+update_check_enabled = True
+update_check_interval = 24 * 60 * 60
+update_check_thread = None
+update_check_reported = False
+
+# Optional content-addressed store of mod files, keyed by SHA1 and shared by every server on
+# the host. Files are hardlinked from the store into each mods folder, so identical jars are
+# only downloaded and stored once.
+store_dir = os.environ.get("MCMM_STORE_DIR")
+
+
+def get_http_session():
+    import requests
+    global http_session
+    with http_session_lock:
+        if http_session is None:
+            pool_size = max(http_pool_size, jobs)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            http_session = requests.Session()
+            http_session.mount("https://", adapter)
+            http_session.mount("http://", adapter)
+            http_session.headers.update({
+                "User-Agent": f"kennethprose/MinecraftModManager/{version}",
+                "Accept-Encoding": "gzip, deflate"
+            })
+        return http_session
+
+
+def http_request(method, url, **kwargs):
+    kwargs.setdefault("timeout", http_timeout)
+    return get_http_session().request(method, url, **kwargs)
+
+
+class APIError(Exception):
+    # Raised when an API could not give an answer, as opposed to answering that something
+    # does not exist
+    pass
+
+
+class RateLimiter:
+
+    # Token bucket for a single host. Hosts without a known limit are only held back after
+    # they have told us to slow down.
+
+    def __init__(self, limit=None, window=api_rate_limit_window):
+        self.limit = limit
+        self.window = window
+        self.tokens = limit or 0
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.blocked_until - now
+                if self.limit:
+                    self.tokens = min(self.limit, self.tokens +
+                                      (now - self.updated_at) * self.limit / self.window)
+                    self.updated_at = now
+                    wait = max(wait, (1 - self.tokens) * self.window / self.limit)
+                if wait <= 0:
+                    if self.limit:
+                        self.tokens -= 1
+                    return
+            profile_count("rate_limit_wait_seconds", wait)
+            time.sleep(wait)
+
+    def block(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def update(self, response):
+        try:
+            limit = int(response.headers["X-Ratelimit-Limit"])
+            remaining = int(response.headers["X-Ratelimit-Remaining"])
+            reset = float(response.headers["X-Ratelimit-Reset"])
+        except (KeyError, ValueError):
+            return
+        with self.lock:
+            if self.limit is None:
+                self.tokens = remaining
+            self.limit = limit
+            self.tokens = min(self.tokens, remaining)
+        if remaining <= 0:
+            self.block(reset)
+
+
+def get_rate_limiter(url):
+    host = urllib.parse.urlsplit(url).netloc
+    with rate_limiters_lock:
+        if host not in rate_limiters:
+            rate_limiters[host] = RateLimiter(api_rate_limits.get(host))
+        return rate_limiters[host]
+
+
+def get_retry_delay(response, attempt):
+    # Use the delay the API asked for if there is one, otherwise back off exponentially
+    if response is not None and response.status_code == 429:
+        for header in ("Retry-After", "X-Ratelimit-Reset"):
+            try:
+                return float(response.headers[header])
+            except (KeyError, ValueError):
+                pass
+    return random.uniform(0, min(api_backoff_max, api_backoff_base * 2 ** attempt))
+
+
+def api_request(method, url, **kwargs):
+    import requests
+    rate_limiter = get_rate_limiter(url)
+
+    for attempt in range(api_retries + 1):
+        rate_limiter.acquire()
+        response = None
+        start = time.perf_counter()
+        try:
+            response = http_request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = str(e)
+        else:
+            record_request(method, url, time.perf_counter() - start)
+            rate_limiter.update(response)
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            error = f"HTTP {response.status_code}"
+
+        if attempt == api_retries:
+            break
+
+        delay = get_retry_delay(response, attempt)
+        profile_count("api_retries")
+        if response is not None and response.status_code == 429:
+            # Hold back every other request to this host as well
+            rate_limiter.block(delay)
+            profile_count("rate_limited")
+        if debug_mode:
+            message(f"Request to {url} failed ({error}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+    raise APIError(f"{method} {url} failed after {api_retries + 1} attempts: {error}")
+
+
+def fetch_latest_version():
+    try:
+        response = http_request(
+            "GET", "https://api.github.com/repos/kennethprose/MinecraftModManager/releases/latest")
+        latest_version = response.json()["tag_name"]
+        write_cache_file(os.path.join(cache_dir, "latest_release.json"), {
+            "checked_at": time.time(),
+            "latest_version": latest_version
+        })
+    except Exception as e:
+        # Not being able to reach GitHub should never get in the way of managing mods
+        if debug_mode:
+            message(f"Could not check for a new version of MCModManager: {e}")
+
+
+def start_new_version_check():
+    # Look for a new release in the background, unless a recent result is already cached
+    global update_check_thread
+    if not update_check_enabled or offline_mode:
+        return
+
+    cached = read_cache_file(os.path.join(cache_dir, "latest_release.json"))
+    if cached and time.time() - cached["checked_at"] < update_check_interval:
+        return
 
-def check_new_version():
-    response = requests.get(
-        "https://api.github.com/repos/kennethprose/MinecraftModManager/releases/latest")
-    latest_version = response.json()["tag_name"]
+    update_check_thread = threading.Thread(target=fetch_latest_version, daemon=True)
+    update_check_thread.start()
+
+
+def check_new_version(timeout=0):
+    # Report the result of the latest check. Waits at most 'timeout' seconds for a check that
+    # is still running; if it hasn't finished, it will be reported by a later run instead.
+    global update_check_reported
+    if not update_check_enabled or update_check_reported:
+        return
+
+    if update_check_thread is not None:
+        update_check_thread.join(timeout)
+
+    cached = read_cache_file(os.path.join(cache_dir, "latest_release.json"))
+    if not cached:
+        return
+
+    update_check_reported = True
+    latest_version = cached["latest_version"]
     if latest_version > version:
         message(
             f"[ALERT] A new verison of MCModManager is available. Download {latest_version} here: https://github.com/kennethprose/MinecraftModManager/releases/tag/{latest_version}")
 
 
 def message(message=""):
-    current_time = datetime.datetime.now()
-    formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{formatted_time}] {message}")
+    formatted_time = time.strftime("%Y-%m-%d %H:%M:%S")
+    with message_lock:
+        print(f"[{formatted_time}] {message}")
 
 
-def modrinth_api_call(endpoint):
-    base_url = "https://api.modrinth.com/v2"
-    url = base_url + endpoint
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
+def profile_count(name, amount=1):
+    if profile_path is None:
+        return
+    with profile_lock:
+        profile_counters[name] = profile_counters.get(name, 0) + amount
+
+
+def record_profile_time(table, name, seconds, histogram=False):
+    with profile_lock:
+        entry = table.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        entry["count"] += 1
+        entry["total"] += seconds
+        entry["max"] = max(entry["max"], seconds)
+        if histogram:
+            buckets = entry.setdefault("histogram", [0] * (len(profile_latency_buckets) + 1))
+            buckets[bisect.bisect_left(profile_latency_buckets, seconds)] += 1
+
+
+def profiled(phase):
+    # Decorator that adds the time spent in the function to a phase of the profile. Phases
+    # can be nested, so their times can add up to more than the whole run.
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if profile_path is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record_profile_time(profile_phases, phase, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def get_endpoint_name(method, url):
+    # Group requests by endpoint by replacing IDs, slugs and hashes in the path
+    url_parts = urllib.parse.urlsplit(url)
+    path = "/".join(part if part in profile_endpoint_words else "{id}"
+                    for part in url_parts.path.split("/") if part)
+    return f"{method} {url_parts.netloc}/{path}"
+
+
+def record_request(method, url, seconds):
+    if profile_path is not None:
+        record_profile_time(profile_requests, get_endpoint_name(method, url), seconds, histogram=True)
+
+
+def write_profile():
+    def summarize(entry):
+        summary = {
+            "count": entry["count"],
+            "total": round(entry["total"], 6),
+            "mean": round(entry["total"] / entry["count"], 6),
+            "max": round(entry["max"], 6)
+        }
+        if "histogram" in entry:
+            labels = [f"<={bucket}s" for bucket in profile_latency_buckets] + [f">{profile_latency_buckets[-1]}s"]
+            summary["histogram"] = dict(zip(labels, entry["histogram"]))
+        return summary
+
+    with profile_lock:
+        counters = dict(profile_counters)
+        report = {
+            "mcmm_version": version,
+            "arguments": sys.argv[1:],
+            "wall_time": round(time.perf_counter() - profile_started_at, 6),
+            "phases": {name: summarize(entry) for name, entry in profile_phases.items()},
+            "requests": {name: summarize(entry) for name, entry in sorted(profile_requests.items())},
+            "counters": counters
+        }
+
+    cache_lookups = sum(counters.get(name, 0) for name in ("cache_hits", "cache_revalidated", "cache_misses"))
+    if cache_lookups:
+        report["cache_hit_rate"] = round(
+            (counters.get("cache_hits", 0) + counters.get("cache_revalidated", 0)) / cache_lookups, 4)
+
+    try:
+        with open(profile_path, "w") as file:
+            json.dump(report, file, indent=4)
+    except OSError as e:
+        message(f"[ERROR]: Could not write the profile to {profile_path}: {e}")
+
+
+def get_cache_path(key):
+    return os.path.join(cache_dir, "http", key[:2], key + ".json")
+
+
+def read_cache_file(path):
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
         return None
 
 
-def curseforge_api_call(endpoint):
-    base_url = "https://api.curseforge.com"
-    url = base_url + endpoint
+def write_cache_file(path, data):
+    # Write to a temporary file first, so other processes never see a partially written file
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def read_cache_entry(key):
+    return read_cache_file(get_cache_path(key))
+
+
+def write_cache_entry(key, entry):
+    global cache_prune_registered
+    try:
+        write_cache_file(get_cache_path(key), entry)
+    except OSError as e:
+        if debug_mode:
+            message(f"Could not write to the cache: {e}")
+        return
+
+    if not cache_prune_registered:
+        cache_prune_registered = True
+        atexit.register(prune_cache)
+
+
+def prune_cache():
+    # Remove the least recently used entries until the cache is back under its size limit.
+    # Entries are touched whenever they are used, so the modification time is the last use.
+    entries = []
+    total_size = 0
+    for root, dirs, files in os.walk(os.path.join(cache_dir, "http")):
+        for filename in files:
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+    if total_size <= cache_max_size:
+        return
+
+    entries.sort()
+    for mtime, size, path in entries:
+        if total_size <= cache_max_size * 0.9:
+            break
+        try:
+            os.remove(path)
+            total_size -= size
+        except OSError:
+            pass
+
+
+def get_cache_ttl(url):
+    ttl = next((ttl for pattern, ttl in cache_ttls if pattern in url), cache_default_ttl)
+    if cache_max_ttl is not None:
+        return min(ttl, cache_max_ttl)
+    return ttl
+
+
+def cached_api_call(url, headers=None, body=None):
+    # Returns the decoded JSON response, or None if the API answered with an error such as
+    # 404. Raises APIError if the API could not be reached. Only successful responses are cached.
+    import hashlib
+    method = "GET" if body is None else "POST"
+    key = hashlib.sha256(
+        json.dumps([method, url, body], sort_keys=True).encode()).hexdigest()
+    headers = dict(headers or {})
+
+    entry = read_cache_entry(key) if cache_enabled else None
+    if entry:
+        if time.time() - entry["stored_at"] < get_cache_ttl(url):
+            try:
+                os.utime(get_cache_path(key))
+            except OSError:
+                pass
+            profile_count("cache_hits")
+            return entry["body"]
+
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = api_request(method, url, headers=headers, json=body)
+
+    if response.status_code == 304 and entry:
+        profile_count("cache_revalidated")
+        entry["stored_at"] = time.time()
+        write_cache_entry(key, entry)
+        return entry["body"]
+
+    if cache_enabled:
+        profile_count("cache_misses")
+
+    if response.status_code != 200:
+        return None
+
+    response_body = response.json()
+    if cache_enabled:
+        write_cache_entry(key, {
+            "url": url,
+            "stored_at": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body": response_body
+        })
+    return response_body
+
+
+def modrinth_api_call(endpoint, body=None):
+    url = modrinth_api_url + endpoint
+    return cached_api_call(url, body=body)
+
+
+def curseforge_api_call(endpoint, body=None):
+    url = curseforge_api_url + endpoint
     headers = {
         "x-api-key": curseforge_api_key}
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        return None
+    return cached_api_call(url, headers=headers, body=body)
+
+
+def format_size(size):
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def get_stored_file_path(hashes):
+    if store_dir and hashes and hashes.get("sha1"):
+        sha1 = hashes["sha1"]
+        return os.path.join(store_dir, "sha1", sha1[:2], sha1 + ".jar")
+    return None
 
 
-def download_mod(url, filename):
+def stream_to_file(url, filepath, hashes=None, part_path=None):
+    # Download into a .part file next to the destination and only rename it into place once
+    # it is complete and matches the expected hashes. If the transfer is interrupted, the
+    # download is resumed from where it stopped with a Range request.
+    import hashlib
+    import requests
+    part_path = part_path or filepath + ".part"
+    hashes = hashes or {}
+    resumed = os.path.exists(part_path)
+    size = 0
+
+    for attempt in range(download_retries + 1):
+        try:
+            # Hash anything left over from an earlier attempt, so the whole file gets verified
+            hashers = {algorithm: hashlib.new(algorithm) for algorithm in hashes}
+            existing_size = 0
+            if os.path.exists(part_path):
+                with open(part_path, "rb") as file:
+                    for chunk in iter(lambda: file.read(download_chunk_size), b''):
+                        for hasher in hashers.values():
+                            hasher.update(chunk)
+                        existing_size += len(chunk)
+
+            headers = {"Range": f"bytes={existing_size}-"} if existing_size else {}
+
+            with http_request("GET", url, stream=True, headers=headers) as r:
+                if r.status_code == 416:
+                    # The partial file is no use to the server, start over
+                    os.remove(part_path)
+                    continue
+                if r.status_code == 429 or r.status_code >= 500:
+                    raise requests.HTTPError(f"HTTP {r.status_code}", response=r)
+                r.raise_for_status()
+
+                # The server may ignore the Range header and send the whole file
+                if r.status_code != 206 and existing_size:
+                    hashers = {algorithm: hashlib.new(algorithm) for algorithm in hashes}
+                    existing_size = 0
+
+                mode = "ab" if existing_size else "wb"
+                with open(part_path, mode, buffering=download_chunk_size) as f:
+                    for chunk in r.iter_content(chunk_size=download_chunk_size):
+                        f.write(chunk)
+                        for hasher in hashers.values():
+                            hasher.update(chunk)
+                        size += len(chunk)
+            break
+
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            # Rate limits and server errors are worth retrying, other HTTP errors are not
+            response = e.response if isinstance(e, requests.HTTPError) else None
+            if response is not None and response.status_code != 429 and response.status_code < 500:
+                raise
+            if attempt == download_retries:
+                raise
+            delay = get_retry_delay(response, attempt)
+            profile_count("download_retries")
+            if debug_mode:
+                message(f"Download of {os.path.basename(filepath)} interrupted ({e}), resuming in {delay:.1f}s")
+            time.sleep(delay)
+    else:
+        raise IOError(f"Could not download {url}")
+
+    for algorithm, hasher in hashers.items():
+        if hasher.hexdigest() != hashes[algorithm]:
+            os.remove(part_path)
+            # A partial file left behind by an earlier run may have been corrupted, so
+            # download the whole file once more before giving up
+            if resumed:
+                return stream_to_file(url, filepath, hashes, part_path)
+            raise ValueError(
+                f"{algorithm.upper()} mismatch, expected {hashes[algorithm]} but got {hasher.hexdigest()}")
+
+    os.replace(part_path, filepath)
+    profile_count("bytes_downloaded", size)
+    profile_count("files_downloaded")
+    return size
+
+
+def link_file(source_path, filepath):
+    temp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(source_path, temp_path)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # Hardlinks do not work across filesystems, so fall back to a copy
+        shutil.copyfile(source_path, temp_path)
+    os.replace(temp_path, filepath)
+
+
+def download_mod(url, filename, hashes=None, directory="mods"):
     if debug_mode:
         message("Downloading " + filename)
-    if not os.path.exists("mods"):
-        os.makedirs("mods")
-    filepath = os.path.join("mods", filename)
-    with requests.get(url, stream=True) as r:
-        r.raise_for_status()
-        with open(filepath, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    filepath = os.path.join(directory, filename)
+    store_path = get_stored_file_path(hashes)
+    start_time = time.monotonic()
+    size = 0
+
+    if store_path is None:
+        size = stream_to_file(url, filepath, hashes)
+    else:
+        # Another server may remove the last reference to the stored file between the
+        # check and the link, in which case the file is downloaded again
+        for attempt in range(2):
+            if not os.path.exists(store_path):
+                os.makedirs(os.path.dirname(store_path), exist_ok=True)
+                # Other processes sharing the store may be downloading the same file, so each
+                # download gets its own .part file
+                part_path = f"{store_path}.{os.getpid()}.{threading.get_ident()}.part"
+                try:
+                    size = stream_to_file(url, store_path, hashes, part_path)
+                except OSError:
+                    # Files only get into the store once they are verified, so if another
+                    # process finished the same download in the meantime, use its copy
+                    if not os.path.exists(store_path):
+                        raise
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+            else:
+                profile_count("store_hits")
+                if debug_mode:
+                    message(f"Found {filename} in the jar store")
+            try:
+                link_file(store_path, filepath)
+                break
+            except FileNotFoundError:
+                if attempt == 1:
+                    raise
+
+    elapsed = max(time.monotonic() - start_time, 0.001)
     if debug_mode:
-        message("Downloaded " + filename)
+        message(
+            f"Downloaded {filename} ({format_size(size)} in {elapsed:.2f}s, {format_size(size / elapsed)}/s)")
+    return size
+
+
+def remove_mod_file(filename, hashes=None):
+    try:
+        os.remove(os.path.join("mods", filename))
+    except FileNotFoundError:
+        # Already deleted by hand, so there's nothing left to remove
+        pass
+    release_stored_file(filename, hashes)
+
+
+def release_stored_file(filename, hashes=None):
+    # Stored files are hardlinked into each mods folder, so once the store holds the only
+    # remaining link, no server uses the file anymore and it can be deleted
+    store_path = get_stored_file_path(hashes)
+    try:
+        if store_path and os.stat(store_path).st_nlink <= 1:
+            os.remove(store_path)
+            if debug_mode:
+                message(f"Removed {filename} from the jar store")
+    except FileNotFoundError:
+        pass
+
+
+@profiled("downloads")
+def download_mods(downloads, directory="mods"):
+    # Takes a list of (url, filename, hashes) tuples, downloads them concurrently and
+    # returns the filenames of any downloads that failed
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    failed = []
+    total_size = 0
+    start_time = time.monotonic()
+
+    if not downloads:
+        return failed
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {executor.submit(download_mod, url, filename, hashes, directory): filename
+                   for url, filename, hashes in downloads}
+
+        for completed, future in enumerate(as_completed(futures), start=1):
+            filename = futures[future]
+            try:
+                total_size += future.result()
+                if debug_mode:
+                    message(f"[{completed}/{len(downloads)}] {filename}")
+            except Exception as e:
+                message(f"[ERROR]: Failed to download {filename}: {e}")
+                failed.append(filename)
+
+    elapsed = max(time.monotonic() - start_time, 0.001)
+    message(
+        f"Downloaded {len(downloads) - len(failed)} of {len(downloads)} mods ({format_size(total_size)} in {elapsed:.2f}s, {format_size(total_size / elapsed)}/s)")
+    if failed:
+        message(f"[ERROR]: {len(failed)} downloads failed: " + ", ".join(failed))
+
+    return failed
+
+
+class Manifest:
+
+    # The contents of mcmm.json, loaded once per command and kept in memory. Mods are
+    # indexed by ID and slug, and nothing is written back to disk until save() is called.
+    # Commands that change the manifest hold an exclusive lock on it from loading to saving,
+    # so two commands running at once can't overwrite each other's changes.
+
+    @profiled("manifest_load")
+    def __init__(self, path="mcmm.json", shared=False):
+        self.path = path
+        self.lock_file = None
+        self.lock(shared)
+        self.data = self.read()
+
+        self.mods_by_id = {}
+        self.mods_by_slug = {}
+        for mod in self.data["mods"]:
+            self.index_mod(mod)
+
+        self.changed = False
+
+    def read(self):
+        with open(self.path, "r") as file:
+            return json.load(file)
+
+    def lock(self, shared=False):
+        if fcntl is None or self.lock_file:
+            return
+        self.lock_file = open(self.path + ".lock", "a")
+        mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(self.lock_file, mode | fcntl.LOCK_NB)
+        except BlockingIOError:
+            message(f"Waiting for another command to finish with {self.path}")
+            fcntl.flock(self.lock_file, mode)
+
+    def unlock(self):
+        if self.lock_file:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def close(self):
+        self.unlock()
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.changed = True
+
+    @property
+    def mods(self):
+        return list(self.mods_by_id.values())
+
+    def index_mod(self, mod):
+        self.mods_by_id[mod["mod_id"]] = mod
+        # Mods from different sources may share a slug, the first one added wins
+        self.mods_by_slug.setdefault(mod["mod_slug"], []).append(mod)
+
+    def find_mod(self, slug_or_id):
+        if slug_or_id in self.mods_by_id:
+            return self.mods_by_id[slug_or_id]
+        mods = self.mods_by_slug.get(slug_or_id)
+        return mods[0] if mods else None
+
+    def add_mod(self, mod):
+        self.index_mod(mod)
+        self.changed = True
+
+    def remove_mod(self, mod):
+        del self.mods_by_id[mod["mod_id"]]
+        mods = self.mods_by_slug[mod["mod_slug"]]
+        mods.remove(mod)
+        if not mods:
+            del self.mods_by_slug[mod["mod_slug"]]
+        self.changed = True
+
+    def mark_changed(self):
+        self.changed = True
+
+    @profiled("manifest_save")
+    def save(self):
+        if not self.changed:
+            return
+        self.data["mods"] = self.mods
+        # Write to a temporary file first, so the manifest is replaced in one step
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self.data, file, indent=4)
+        os.replace(temp_path, self.path)
+        self.changed = False
+
+
+class SQLiteManifest(Manifest):
+
+    # The manifest kept in an SQLite database in WAL mode, so readers never see a half-written
+    # manifest. Every mod is a row keyed by its ID. It is locked the same way as mcmm.json, and
+    # save() only writes the mods this command added, changed or removed, in one transaction.
+
+    def read(self):
+        self.connection = open_manifest_db(self.path)
+        data = {key: json.loads(value) for key, value in self.connection.execute("SELECT key, value FROM settings")}
+        data["mods"] = [json.loads(row) for (row,) in self.connection.execute("SELECT data FROM mods ORDER BY position")]
+
+        self.saved_settings = {key: json.dumps(value) for key, value in data.items() if key != "mods"}
+        self.saved_mods = {mod["mod_id"]: json.dumps(mod) for mod in data["mods"]}
+        self.removed_mod_ids = set()
+        return data
+
+    def close(self):
+        # The connection stays open while unlocked, since watch mode saves between reloads
+        self.connection.close()
+        super().close()
+
+    def add_mod(self, mod):
+        super().add_mod(mod)
+        self.removed_mod_ids.discard(mod["mod_id"])
+
+    def remove_mod(self, mod):
+        super().remove_mod(mod)
+        self.removed_mod_ids.add(mod["mod_id"])
+
+    @profiled("manifest_save")
+    def save(self):
+        if not self.changed:
+            return
+        self.data["mods"] = self.mods
+        settings = {key: json.dumps(value) for key, value in self.data.items() if key != "mods"}
+        mods = {mod["mod_id"]: (mod, json.dumps(mod)) for mod in self.data["mods"]}
+
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            for key, value in settings.items():
+                if self.saved_settings.get(key) != value:
+                    self.connection.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+            for key in self.saved_settings.keys() - settings.keys():
+                self.connection.execute("DELETE FROM settings WHERE key = ?", (key,))
+
+            for mod_id, (mod, row) in mods.items():
+                if self.saved_mods.get(mod_id) == row:
+                    continue
+                if mod_id in self.saved_mods:
+                    self.connection.execute("UPDATE mods SET mod_slug = ?, source = ?, data = ? WHERE mod_id = ?",
+                                            (mod["mod_slug"], mod["source"], row, mod_id))
+                else:
+                    # New mods go to the end
+                    self.connection.execute(
+                        "INSERT INTO mods (mod_id, mod_slug, source, position, data) "
+                        "VALUES (?, ?, ?, (SELECT COALESCE(MAX(position), -1) + 1 FROM mods), ?)",
+                        (mod_id, mod["mod_slug"], mod["source"], row))
+            for mod_id in self.removed_mod_ids:
+                self.connection.execute("DELETE FROM mods WHERE mod_id = ?", (mod_id,))
+
+        self.saved_settings = settings
+        self.saved_mods = {mod_id: row for mod_id, (mod, row) in mods.items()}
+        self.removed_mod_ids = set()
+        self.changed = False
+
+
+def open_manifest_db(path):
+    import sqlite3
+    connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    connection.execute("CREATE TABLE IF NOT EXISTS mods (mod_id TEXT PRIMARY KEY, mod_slug TEXT NOT NULL, "
+                       "source TEXT NOT NULL, position INTEGER NOT NULL, data TEXT NOT NULL)")
+    # Commands load every mod into the Manifest and look mods up in its in-memory indexes,
+    # since nearly every command needs all of them anyway. These indexes are for reading single
+    # mods by slug or source straight from the database, like with the sqlite3 shell or a
+    # monitoring script, without scanning the whole table.
+    connection.execute("CREATE INDEX IF NOT EXISTS mods_by_slug ON mods (mod_slug)")
+    connection.execute("CREATE INDEX IF NOT EXISTS mods_by_source ON mods (source)")
+    return connection
+
+
+def open_manifest(directory=".", shared=False):
+    # Use the SQLite database if the server has been migrated to it, mcmm.json otherwise
+    db_path = os.path.normpath(os.path.join(directory, manifest_db_path))
+    if os.path.exists(db_path):
+        return SQLiteManifest(db_path, shared)
+    return Manifest(os.path.normpath(os.path.join(directory, "mcmm.json")), shared)
+
+
+def load_manifest(shared=False):
+    global manifest
+    if manifest:
+        manifest.close()
+    manifest = open_manifest(shared=shared)
+
+
+def migrate_to_sqlite():
+    if os.path.exists(manifest_db_path):
+        message(f"[ERROR]: The manifest has already been migrated to {manifest_db_path}")
+        sys.exit(1)
+
+    json_manifest = manifest
+    temp_path = manifest_db_path + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    # Build the database next to the final one and move it into place once it is complete
+    db_manifest = SQLiteManifest(temp_path)
+    for key, value in json_manifest.data.items():
+        if key != "mods":
+            db_manifest[key] = value
+    for mod in json_manifest.mods:
+        db_manifest.add_mod(mod)
+    db_manifest.save()
+    db_manifest.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db_manifest.close()
+    if os.path.exists(temp_path + ".lock"):
+        os.remove(temp_path + ".lock")
+    os.replace(temp_path, manifest_db_path)
+
+    os.replace("mcmm.json", "mcmm.json.migrated")
+    json_manifest.unlock()
+    message(f"Migrated {len(json_manifest.mods)} mods to {manifest_db_path}. The old manifest was kept as mcmm.json.migrated")
 
 
 def init_json_file():
-    if os.path.exists("mcmm.json"):
+    if os.path.exists("mcmm.json") or os.path.exists(manifest_db_path):
         return
     else:
         message("[ERROR] Could not find mcmm.json")
@@ -75,20 +1021,13 @@ def init_json_file():
 
 
 def init_server_version():
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-
-    if "server_version" not in data:
+    if "server_version" not in manifest:
         message("[ERROR]: Server version not set. Set the server version using the -s flag. See usage (-h) for more information.")
         exit()
 
 
 def check_for_curseforge_mods():
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-        mods = data["mods"]
-
-    for mod in mods:
+    for mod in manifest.mods:
         if mod["source"] == 'curseforge':
             return True
 
@@ -96,12 +1035,9 @@ def check_for_curseforge_mods():
 
 
 def init_api_key(caller):
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-
-    if "curseforge_api_key" in data:
+    if "curseforge_api_key" in manifest:
         global curseforge_api_key
-        curseforge_api_key = data["curseforge_api_key"]
+        curseforge_api_key = manifest["curseforge_api_key"]
     elif caller == 'check' and not check_for_curseforge_mods():
         return
     else:
@@ -109,15 +1045,49 @@ def init_api_key(caller):
         sys.exit()
 
 
-def check_version_exists(version):
+@profiled("game_versions")
+def get_game_versions():
+    global game_versions
+    if game_versions is not None:
+        return game_versions
 
-    valid_versions = modrinth_api_call("/tag/game_version")
+    path = os.path.join(cache_dir, "game_versions.json")
+    cached = read_cache_file(path)
 
-    for v in valid_versions:
-        if v["version"] == version:
-            return True
+    if cached and (offline_mode or time.time() - cached["fetched_at"] < game_versions_refresh_interval):
+        game_versions = set(cached["versions"])
+        return game_versions
 
-    return False
+    if offline_mode:
+        message("[ERROR]: The list of Minecraft versions has not been cached yet. Run the command once without --offline.")
+        exit()
+
+    try:
+        valid_versions = modrinth_api_call("/tag/game_version")
+    except APIError:
+        valid_versions = None
+
+    if valid_versions is None:
+        if not cached:
+            message("[ERROR]: Could not get the list of Minecraft versions from Modrinth")
+            exit()
+        message("Could not refresh the list of Minecraft versions, using the cached list")
+        game_versions = set(cached["versions"])
+        return game_versions
+
+    game_versions = {v["version"] for v in valid_versions}
+
+    try:
+        write_cache_file(path, {"fetched_at": time.time(), "versions": sorted(game_versions)})
+    except OSError as e:
+        if debug_mode:
+            message(f"Could not write to the cache: {e}")
+
+    return game_versions
+
+
+def check_version_exists(version):
+    return version in get_game_versions()
 
 
 def set_server_version(version):
@@ -126,122 +1096,325 @@ def set_server_version(version):
         message("[ERROR]: " + version + " is not a valid Minecraft version")
         exit()
 
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
+    manifest["server_version"] = version
+    manifest.save()
 
-    data["server_version"] = version
 
-    with open("mcmm.json", "w") as file:
-        json.dump(data, file, indent=4)
+def set_curseforge_api_key(key):
+    manifest["curseforge_api_key"] = key
+    manifest.save()
 
 
-def set_curseforge_api_key(key):
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-        data["curseforge_api_key"] = key
+def check_mod_exists(slug_or_id):
+    return manifest.find_mod(slug_or_id) is not None
 
-    with open("mcmm.json", "w") as file:
-        json.dump(data, file, indent=4)
 
+def get_projects(source, slugs_or_ids):
+    # Look up all of the projects at once. Returns a dict that maps each ID and slug that
+    # was found to the mod's name, ID and slug.
+    projects = {}
 
-def check_mod_exists(slug_or_id):
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-        mods = data["mods"]
+    if source == 'modrinth':
+        for mod_info in get_modrinth_projects(slugs_or_ids) or []:
+            project = {
+                "mod_name": mod_info["title"],
+                "mod_id": mod_info["id"],
+                "mod_slug": mod_info["slug"]
+            }
+            projects[mod_info["id"]] = project
+            projects[mod_info["slug"]] = project
+
+    elif source == 'curseforge':
+        # CurseForge can only look up mods by their numeric ID
+        mod_ids = [int(mod_id) for mod_id in slugs_or_ids if mod_id.isdigit()]
+        mod_infos = curseforge_api_call("/v1/mods", {"modIds": mod_ids}) if mod_ids else None
+        for mod_info in (mod_infos or {}).get("data", []):
+            projects[str(mod_info["id"])] = {
+                "mod_name": mod_info["name"],
+                "mod_id": str(mod_info["id"]),
+                "mod_slug": mod_info["slug"]
+            }
 
-    for i, mod in enumerate(mods):
+    return projects
+
+
+@profiled("mod_lookups")
+def resolve_mods(source, slugs_or_ids, server_version):
+    # Find the newest version of each mod for the server version. Returns a dict that maps
+    # each slug or ID to a new mod record, and a dict that maps the ones that could not be
+    # resolved to the reason why.
+    from concurrent.futures import ThreadPoolExecutor
+    resolved = {}
+    errors = {}
+
+    try:
+        projects = get_projects(source, slugs_or_ids)
+    except APIError as e:
+        return resolved, {slug_or_id: f"Could not look up {slug_or_id}: {e}" for slug_or_id in slugs_or_ids}
+
+    for slug_or_id in slugs_or_ids:
+        if slug_or_id not in projects:
+            suggestions = suggest_slugs(slug_or_id) if source == 'modrinth' else []
+            if suggestions:
+                errors[slug_or_id] = f"{slug_or_id} not found. Did you mean {' or '.join(suggestions)}?"
+            elif source == 'modrinth':
+                errors[slug_or_id] = f"{slug_or_id} not found. Make sure the slug/ID is correct."
+            else:
+                errors[slug_or_id] = f"{slug_or_id} not found. Make sure the ID is correct."
+
+    found = [slug_or_id for slug_or_id in slugs_or_ids if slug_or_id in projects]
+
+    # Find the newest version of every mod concurrently
+    def get_newest_version(slug_or_id):
+        try:
+            return get_mod_update_info(dict(projects[slug_or_id], source=source), server_version)
+        except APIError as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        newest_versions = list(executor.map(get_newest_version, found))
+
+    for slug_or_id, newest_version in zip(found, newest_versions):
+        mod = projects[slug_or_id]
+        if isinstance(newest_version, APIError):
+            errors[slug_or_id] = f"Could not look up {mod['mod_name']}: {newest_version}"
+        elif newest_version is None:
+            errors[slug_or_id] = f"{mod['mod_name']} is not available for Minecraft {server_version}"
+        else:
+            resolved[slug_or_id] = {
+                "mod_name": mod["mod_name"],
+                "mod_slug": mod["mod_slug"],
+                "mod_id": mod["mod_id"],
+                "mod_version_id": newest_version["new_version_id"],
+                "filename": newest_version["new_filename"],
+                "download_url": newest_version["new_download_url"],
+                "hashes": newest_version["new_hashes"],
+                "dependencies": newest_version["new_dependencies"],
+                "current_version": server_version,
+                "source": source
+            }
 
-        if mod["mod_id"] == slug_or_id or mod["mod_slug"] == slug_or_id:
-            return True
+    return resolved, errors
 
-    return False
+
+def load_dependency_graph():
+    global dependency_graph
+    if dependency_graph is None:
+        dependency_graph = read_cache_file(os.path.join(cache_dir, "dependency_graph.json")) or {}
+    return dependency_graph
+
+
+def save_dependency_graph():
+    try:
+        write_cache_file(os.path.join(cache_dir, "dependency_graph.json"), load_dependency_graph())
+    except OSError as e:
+        if debug_mode:
+            message(f"Could not write to the cache: {e}")
+
+
+def get_mod_dependencies(mods):
+    # Returns the IDs of the required dependencies of each mod, keyed by mod ID. Mods installed
+    # before dependencies were recorded are looked up by their version in the dependency graph
+    # cache, and whatever is missing from there is fetched from the APIs in batches. The
+    # dependencies of a version never change, so cached entries do not expire.
+    graph = load_dependency_graph()
+    dependencies = {}
+    missing = {'modrinth': [], 'curseforge': []}
+
+    for mod in mods:
+        key = f"{mod['source']}:{mod['mod_version_id']}"
+        if mod.get("dependencies") is not None:
+            dependencies[mod["mod_id"]] = mod["dependencies"]
+            graph[key] = mod["dependencies"]
+        elif key in graph:
+            dependencies[mod["mod_id"]] = graph[key]
+        elif mod["source"] in missing:
+            missing[mod["source"]].append(mod)
+
+    version_ids = [mod["mod_version_id"] for mod in missing['modrinth']]
+    for i in range(0, len(version_ids), modrinth_ids_batch_size):
+        batch = modrinth_api_call(
+            "/versions?ids=" + json.dumps(version_ids[i:i + modrinth_ids_batch_size], separators=(",", ":")))
+        for mod_version in batch or []:
+            graph[f"modrinth:{mod_version['id']}"] = get_modrinth_dependencies(mod_version)
+
+    file_ids = [int(mod["mod_version_id"]) for mod in missing['curseforge']]
+    if file_ids:
+        files = curseforge_api_call("/v1/mods/files", {"fileIds": file_ids})
+        for file in (files or {}).get("data", []):
+            graph[f"curseforge:{file['id']}"] = get_curseforge_dependencies(file)
+
+    for mod in missing['modrinth'] + missing['curseforge']:
+        dependencies[mod["mod_id"]] = graph.get(f"{mod['source']}:{mod['mod_version_id']}", [])
+
+    save_dependency_graph()
+    return dependencies
+
+
+def find_dependency_cycles(graph):
+    # Depth first search over the dependency graph, returning each cycle that is found
+    cycles = []
+    visited = set()
+
+    def visit(mod_id, path):
+        if mod_id in path:
+            cycles.append(path[path.index(mod_id):] + [mod_id])
+            return
+        if mod_id in visited:
+            return
+        visited.add(mod_id)
+        for dependency in graph.get(mod_id, []):
+            visit(dependency, path + [mod_id])
+
+    for mod_id in graph:
+        visit(mod_id, [])
+
+    return cycles
+
+
+@profiled("dependency_resolution")
+def resolve_dependencies(mods, server_version, excluded_mods=()):
+    # Returns the mods that have to be installed so that every required dependency of 'mods',
+    # and of those dependencies in turn, is present. The dependency graph is walked one wave
+    # at a time, with all of the mods in a wave looked up together. Libraries that are already
+    # installed from the other source, going by their slug, are not installed again.
+    installed_mods = [mod for mod in manifest.mods if mod not in excluded_mods] + list(mods)
+    installed_ids = {mod["mod_id"] for mod in installed_mods}
+    installed_slugs = {mod["mod_slug"] for mod in installed_mods}
+    new_mods = []
+
+    try:
+        graph = get_mod_dependencies(mods)
+    except APIError as e:
+        message(f"[ERROR]: Could not look up dependencies: {e}")
+        return new_mods
+
+    sources = {mod["mod_id"]: mod["source"] for mod in mods}
+    wave = [(sources[mod_id], dependency) for mod_id, dependencies in graph.items()
+            for dependency in dependencies]
+    seen = set()
+
+    while wave:
+        dependencies_by_source = {}
+        for source, dependency in wave:
+            if dependency in installed_ids or dependency in seen:
+                continue
+            seen.add(dependency)
+            dependencies_by_source.setdefault(source, []).append(dependency)
+
+        wave = []
+        for source, dependencies in dependencies_by_source.items():
+            resolved, errors = resolve_mods(source, dependencies, server_version)
+
+            for dependency, error in errors.items():
+                message(f"[ERROR]: Could not install a required dependency. {error}")
+
+            for mod in resolved.values():
+                if mod["mod_id"] in installed_ids or mod["mod_slug"] in installed_slugs:
+                    continue
+                installed_ids.add(mod["mod_id"])
+                installed_slugs.add(mod["mod_slug"])
+                new_mods.append(mod)
+                graph[mod["mod_id"]] = mod["dependencies"]
+                wave.extend((source, dependency) for dependency in mod["dependencies"])
+
+    # Cycles don't stop anything from being installed, but none of the mods in one can be
+    # removed on its own
+    mod_names = {mod["mod_id"]: mod["mod_name"] for mod in installed_mods + new_mods}
+    for cycle in find_dependency_cycles(graph):
+        message("Found a dependency cycle: " + " -> ".join(mod_names.get(mod_id, mod_id) for mod_id in cycle))
+
+    return new_mods
+
+
+def install_mods(mods_to_install, dependencies=()):
+    # Download all of the new mods at once and only record the ones that succeeded
+    failed = download_mods([(mod["download_url"], mod["filename"], mod["hashes"])
+                            for mod in list(mods_to_install) + list(dependencies)])
+
+    installed_mods = [mod for mod in mods_to_install if mod["filename"] not in failed]
+    installed_dependencies = [mod for mod in dependencies if mod["filename"] not in failed]
+
+    for mod in installed_mods + installed_dependencies:
+        manifest.add_mod(mod)
+
+    manifest.save()
+
+    for mod in installed_mods:
+        message(mod["mod_name"] + " installed")
+
+    for mod in installed_dependencies:
+        message(mod["mod_name"] + " installed as a dependency")
 
 
 def add_mod(source, mods_to_add):
 
+    if source not in ('modrinth', 'curseforge'):
+        message("[ERROR] \'" + source + "\' is not a valid source")
+        return
+
     mod_list = mods_to_add.split(",")
+    server_version = manifest["server_version"]
 
-    for slug_or_id in mod_list:
+    # Names that aren't slugs, like "Fabric API", are looked up in the local catalog
+    if source == 'modrinth':
+        mod_list = [find_catalog_slug(slug_or_id) or slug_or_id for slug_or_id in mod_list]
 
-        if check_mod_exists(slug_or_id):
+    slugs_or_ids = []
+    for slug_or_id in mod_list:
+        if check_mod_exists(slug_or_id) or slug_or_id in slugs_or_ids:
             message(f"{slug_or_id} is already installed")
-            continue
+        else:
+            slugs_or_ids.append(slug_or_id)
 
-        with open("mcmm.json", "r") as file:
-            data = json.load(file)
-            server_version = data["server_version"]
-            mods = data["mods"]
+    if not slugs_or_ids:
+        return
 
-        if source == 'modrinth':
-            mod_info = modrinth_api_call("/project/" + slug_or_id)
-            if mod_info == None:
-                message(
-                    f"[ERROR]: {slug_or_id} not found. Make sure the slug/ID is correct.")
-                continue
-            mod_name = mod_info["title"]
-            mod_id = mod_info["id"]
-            mod_slug = mod_info["slug"]
-        elif source == 'curseforge':
-            mod_info = curseforge_api_call("/v1/mods/" + slug_or_id)
-            if mod_info == None:
-                message(
-                    f"[ERROR]: {slug_or_id} not found. Make sure the ID is correct.")
-                continue
-            mod_name = mod_info["data"]["name"]
-            mod_id = str(mod_info["data"]["id"])
-            mod_slug = mod_info["data"]["slug"]
-        else:
-            message("[ERROR] \'" + source + "\' is not a valid source")
+    resolved, errors = resolve_mods(source, slugs_or_ids, server_version)
+
+    mods_to_install = []
+    for slug_or_id in slugs_or_ids:
+        if slug_or_id in errors:
+            message(f"[ERROR]: {errors[slug_or_id]}")
+            continue
+
+        new_mod = resolved[slug_or_id]
+        if check_mod_exists(new_mod["mod_id"]) or new_mod["mod_id"] in [mod["mod_id"] for mod in mods_to_install]:
+            message(f"{new_mod['mod_name']} is already installed")
             continue
 
         if debug_mode:
-            message("Adding mod: " + mod_name)
-
-        if source == 'modrinth':
-            mod_versions = modrinth_api_call(
-                f"/project/{slug_or_id}/version?game_versions=[\"{server_version}\"]&loaders=[\"fabric\"]")
-            most_recent_version = mod_versions[0]
-            mod_version_id = most_recent_version["id"]
-            filename = most_recent_version["files"][0]["filename"]
-            download_url = most_recent_version["files"][0]["url"]
-
-        elif source == 'curseforge':
-            mod_versions = curseforge_api_call(
-                f"/v1/mods/{slug_or_id}/files?gameVersion={server_version}&modLoaderType=4")
-            most_recent_version = mod_versions["data"][0]
-            mod_version_id = str(most_recent_version["id"])
-            filename = most_recent_version["fileName"]
-            download_url = most_recent_version["downloadUrl"]
+            message("Adding mod: " + new_mod["mod_name"])
+        mods_to_install.append(new_mod)
 
-        new_mod = {
-            "mod_name": mod_name,
-            "mod_slug": mod_slug,
-            "mod_id": mod_id,
-            "mod_version_id": mod_version_id,
-            "filename": filename,
-            "download_url": download_url,
-            "current_version": server_version,
-            "source": source
-        }
+    dependencies = []
+    if install_dependencies and mods_to_install:
+        dependencies = resolve_dependencies(mods_to_install, server_version)
 
-        mods.append(new_mod)
+    install_mods(mods_to_install, dependencies)
 
-        download_mod(download_url, filename)
 
-        with open("mcmm.json", "w") as file:
-            json.dump(data, file, indent=4)
+def add_missing_dependencies():
+    dependencies = resolve_dependencies(manifest.mods, manifest["server_version"])
+
+    if not dependencies:
+        message("All required dependencies are installed")
+        return
 
-        message(mod_name + " installed")
+    install_mods([], dependencies)
 
 
 def remove_mod_wrapper(mods_to_remove):
-    if mods_to_remove == 'ALL':
-        remove_all_mods()
-        return
-
-    mod_list = mods_to_remove.split(",")
-    for slug_or_id in mod_list:
-        remove_mod(slug_or_id)
+    # Jars are deleted as we go, so the manifest has to record them even if a later removal fails
+    try:
+        if mods_to_remove == 'ALL':
+            remove_all_mods()
+        else:
+            mod_list = mods_to_remove.split(",")
+            for slug_or_id in mod_list:
+                remove_mod(slug_or_id)
+    finally:
+        manifest.save()
 
 
 def remove_mod(slug_or_id):
@@ -249,36 +1422,66 @@ def remove_mod(slug_or_id):
     if debug_mode:
         message(f"Removing {slug_or_id}")
 
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-        mods = data["mods"]
+    mod = manifest.find_mod(slug_or_id)
 
-    for i, mod in enumerate(mods):
+    if mod is None:
+        message(f"{slug_or_id} not found")
+        return
 
-        if mod["mod_id"] == slug_or_id or mod["mod_slug"] == slug_or_id:
+    remove_mod_file(mod["filename"], mod.get("hashes"))
 
-            mod_name = mod["mod_name"]
+    manifest.remove_mod(mod)
 
-            os.remove(os.path.join("mods", mod["filename"]))
+    message(f"Successfully removed {mod['mod_name']}")
 
-            mods.pop(i)
 
-            with open("mcmm.json", "w") as file:
-                json.dump(data, file, indent=4)
+def remove_all_mods():
+    for mod in manifest.mods:
+        remove_mod(mod["mod_id"])
 
-            message(f"Successfully removed {mod_name}")
-            return
 
-    message(f"{slug_or_id} not found")
+def get_modrinth_file_hashes(file):
+    return {algorithm: file["hashes"][algorithm]
+            for algorithm in ("sha1", "sha512") if algorithm in file.get("hashes", {})}
 
 
-def remove_all_mods():
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-        mods = data["mods"]
+def get_curseforge_file_hashes(file):
+    # CurseForge identifies the hash algorithm by number, 1 is SHA1 and 2 is MD5
+    return {"sha1": h["value"] for h in file.get("hashes", []) if h["algo"] == 1}
 
-    for mod in mods:
-        remove_mod(mod["mod_slug"])
+
+def get_modrinth_dependencies(mod_version):
+    # Dependencies that only name a version and not a project are rare and are skipped
+    return [dependency["project_id"] for dependency in mod_version.get("dependencies", [])
+            if dependency["dependency_type"] == "required" and dependency.get("project_id")]
+
+
+def get_curseforge_dependencies(file):
+    # CurseForge identifies the relation by number, 3 is a required dependency
+    return [str(dependency["modId"]) for dependency in file.get("dependencies", [])
+            if dependency["relationType"] == 3]
+
+
+def get_modrinth_update_info(newest_mod_version, version, mod_version_id=None):
+
+    if not mod_version_id or newest_mod_version["id"] != mod_version_id:
+
+        new_mod_version_id = newest_mod_version["id"]
+        new_mod_version_filename = newest_mod_version["files"][0]["filename"]
+        new_mod_version_url = newest_mod_version["files"][0]["url"]
+        new_mod_version_hashes = get_modrinth_file_hashes(newest_mod_version["files"][0])
+        new_mod_version_dependencies = get_modrinth_dependencies(newest_mod_version)
+
+        return {
+            "new_version_id": new_mod_version_id,
+            "new_filename": new_mod_version_filename,
+            "new_download_url": new_mod_version_url,
+            "new_hashes": new_mod_version_hashes,
+            "new_dependencies": new_mod_version_dependencies,
+            "new_version": version
+        }
+
+    return None
 
 
 def get_modrinth_mod_info(mod_slug, version, mod_version_id=None):
@@ -287,22 +1490,63 @@ def get_modrinth_mod_info(mod_slug, version, mod_version_id=None):
         f"/project/{mod_slug}/version?game_versions=[\"{version}\"]&loaders=[\"fabric\"]")
 
     if mod_versions:
-        newest_mod_version = mod_versions[0]
+        return get_modrinth_update_info(mod_versions[0], version, mod_version_id)
 
-        if not mod_version_id or newest_mod_version["id"] != mod_version_id:
+    return None
 
-            new_mod_version_id = newest_mod_version["id"]
-            new_mod_version_filename = newest_mod_version["files"][0]["filename"]
-            new_mod_version_url = newest_mod_version["files"][0]["url"]
 
-            return {
-                "new_version_id": new_mod_version_id,
-                "new_filename": new_mod_version_filename,
-                "new_download_url": new_mod_version_url,
-                "new_version": version
-            }
+def modrinth_bulk_api_call(endpoint, hashes, body=None):
+    # Send the hashes to a Modrinth bulk endpoint in batches and merge the
+    # responses, which are keyed by hash. Returns None if any batch fails.
+    results = {}
+    for i in range(0, len(hashes), modrinth_batch_size):
+        batch = modrinth_api_call(endpoint, {
+            "hashes": hashes[i:i + modrinth_batch_size],
+            "algorithm": "sha1",
+            **(body or {})
+        })
+        if batch is None:
+            return None
+        results.update(batch)
+    return results
+
+
+def get_modrinth_projects(ids):
+    # Look up many projects by ID or slug, a batch at a time so the query string stays short.
+    # Returns None if any batch fails.
+    projects = []
+    for i in range(0, len(ids), modrinth_ids_batch_size):
+        batch = modrinth_api_call(
+            "/projects?ids=" + json.dumps(ids[i:i + modrinth_ids_batch_size], separators=(",", ":")))
+        if batch is None:
+            return None
+        projects.extend(batch)
+    return projects
+
+
+def get_modrinth_mod_info_bulk(hashes, version):
+    # Returns the newest version for each hash that has one for the given Minecraft version,
+    # or None if the versions could not be looked up
+    newest_versions = modrinth_bulk_api_call("/version_files/update", hashes, {
+        "loaders": ["fabric"],
+        "game_versions": [version]
+    })
+    if newest_versions is None:
+        return None
 
-    return None
+    # Hashes that are missing from the response either have no version for the requested
+    # Minecraft version or are not known to Modrinth at all. Only the latter need to be
+    # checked individually.
+    missing_hashes = [h for h in hashes if h not in newest_versions]
+    if missing_hashes:
+        known_versions = modrinth_bulk_api_call("/version_files", missing_hashes)
+        if known_versions is None:
+            return None
+        for h in missing_hashes:
+            if h in known_versions:
+                newest_versions[h] = None
+
+    return newest_versions
 
 
 def get_curseforge_mod_info(mod_id, version, mod_version_id=None):
@@ -319,84 +1563,133 @@ def get_curseforge_mod_info(mod_id, version, mod_version_id=None):
                 new_mod_version_id = str(newest_mod_version["id"])
                 new_mod_version_filename = newest_mod_version["fileName"]
                 new_mod_version_url = newest_mod_version["downloadUrl"]
+                new_mod_version_hashes = get_curseforge_file_hashes(newest_mod_version)
+                new_mod_version_dependencies = get_curseforge_dependencies(newest_mod_version)
 
                 return {
                     "new_version_id": new_mod_version_id,
                     "new_filename": new_mod_version_filename,
                     "new_download_url": new_mod_version_url,
+                    "new_hashes": new_mod_version_hashes,
+                    "new_dependencies": new_mod_version_dependencies,
                     "new_version": version
                 }
 
     return None
 
 
+def get_mod_update_info(mod, version, mod_version_id=None):
+
+    if mod["source"] == 'modrinth':
+        return get_modrinth_mod_info(mod["mod_slug"], version, mod_version_id)
+    elif mod["source"] == 'curseforge':
+        return get_curseforge_mod_info(mod["mod_id"], version, mod_version_id)
+
+    return None
+
+
+def get_mod_file_path(mod):
+    file_path = os.path.join("mods", mod["filename"])
+    if mod["source"] == 'modrinth' and os.path.isfile(file_path):
+        return file_path
+    return None
+
+
+@profiled("update_lookups")
+def find_updates(mods, version, compare_current_version, mod_hashes=None):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def get_mod_version_id(mod):
+        return mod["mod_version_id"] if compare_current_version else None
+
+    def check_mod(mod):
+        try:
+            return get_mod_update_info(mod, version, get_mod_version_id(mod))
+        except APIError as e:
+            return e
+
+    update_infos = {}
+
+    # Modrinth mods that are on disk can be identified by the hash of their file,
+    # which lets all of them be checked with a few bulk requests
+    if mod_hashes is None:
+        mod_file_paths = {id(mod): get_mod_file_path(mod) for mod in mods}
+        file_hashes = get_file_hashes([path for path in mod_file_paths.values() if path])
+        mod_hashes = {mod_id: file_hashes[path]["sha1"] if path else None
+                      for mod_id, path in mod_file_paths.items()}
+    hashes = sorted({h for h in mod_hashes.values() if h})
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+
+        if hashes:
+            try:
+                newest_versions = get_modrinth_mod_info_bulk(hashes, version)
+            except APIError:
+                # Fall back to checking the mods one at a time
+                newest_versions = None
+            if newest_versions is not None:
+                for mod in mods:
+                    mod_hash = mod_hashes.get(id(mod))
+                    if mod_hash in newest_versions:
+                        newest_mod_version = newest_versions[mod_hash]
+                        update_infos[id(mod)] = newest_mod_version and get_modrinth_update_info(
+                            newest_mod_version, version, get_mod_version_id(mod))
+
+        # Check the remaining mods concurrently, one request per mod
+        remaining_mods = [mod for mod in mods if id(mod) not in update_infos]
+        for mod, update_info in zip(remaining_mods, executor.map(check_mod, remaining_mods)):
+            update_infos[id(mod)] = update_info
+
+    # Results are returned in the same order as the mods. Mods that could not be checked
+    # because of an API error get the APIError instead of their update info.
+    return [update_infos[id(mod)] for mod in mods]
+
+
+def record_updates(server_manifest, mods, update_infos):
+    # Store the update info of each checked mod in the manifest. Mods that could not be
+    # checked keep whatever was known about them before.
+    for mod, update_info in zip(mods, update_infos):
+        if isinstance(update_info, APIError):
+            continue
+        if update_info:
+            mod["update"] = update_info
+        else:
+            mod.pop("update", None)
+    server_manifest.mark_changed()
+
+
 def check_updates(version):
 
     if not check_version_exists(version):
         message("[ERROR]: " + version + " is not a valid Minecraft version")
         exit()
 
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-        server_version = data["server_version"]
-        mods = data["mods"]
+    server_version = manifest["server_version"]
+    mods = manifest.mods
 
     mods_with_updates = []
     mods_without_updates = []
+    mods_not_checked = []
 
-    if version == server_version:
-
-        for mod in mods:
-
-            mod_name = mod["mod_name"]
-            mod_slug = mod["mod_slug"]
-            mod_id = mod["mod_id"]
-            mod_version_id = mod["mod_version_id"]
-            mod_source = mod["source"]
-
-            if mod_source == 'modrinth':
-                update_info = get_modrinth_mod_info(
-                    mod_slug, server_version, mod_version_id)
-            elif mod_source == 'curseforge':
-                update_info = get_curseforge_mod_info(
-                    mod_id, server_version, mod_version_id)
-
-            if update_info:
-                mod["update"] = update_info
-                mods_with_updates.append(mod_name)
-            else:
-                try:
-                    del mod["update"]
-                except KeyError:
-                    pass
-                mods_without_updates.append(mod_name)
+    # When checking the current server version, only report mods whose newest version differs
+    # from the installed one. For any other version, every available version is an update.
+    update_infos = find_updates(mods, version, version == server_version)
 
-    else:
-
-        for mod in mods:
+    for mod, update_info in zip(mods, update_infos):
 
-            mod_name = mod["mod_name"]
-            mod_slug = mod["mod_slug"]
-            mod_id = mod["mod_id"]
-            mod_source = mod["source"]
+        mod_name = mod["mod_name"]
 
-            if mod_source == 'modrinth':
-                update_info = get_modrinth_mod_info(mod_slug, version)
-            elif mod_source == 'curseforge':
-                update_info = get_curseforge_mod_info(mod_id, version)
-
-            if update_info:
-                mod["update"] = update_info
-                mods_with_updates.append(mod_name)
-            else:
-                try:
-                    del mod["update"]
-                except KeyError:
-                    pass
-                mods_without_updates.append(mod_name)
+        if isinstance(update_info, APIError):
+            # Keep whatever was known about the mod before
+            message(f"[ERROR]: Could not check {mod_name}: {update_info}")
+            mods_not_checked.append(mod_name)
+        elif update_info:
+            mods_with_updates.append(mod_name)
+        else:
+            mods_without_updates.append(mod_name)
 
-    with open("mcmm.json", "w") as file:
-        json.dump(data, file, indent=4)
+    record_updates(manifest, mods, update_infos)
+    manifest.save()
 
     message()
     message("Updates available for:")
@@ -409,16 +1702,350 @@ def check_updates(version):
         message(mod)
     message()
 
+    if mods_not_checked:
+        message("Could not check (try again later):")
+        for mod in mods_not_checked:
+            message(mod)
+        message()
+
+
+def get_manifest_mtime():
+    # SQLite writes go to the write-ahead log first, so its time counts as well
+    mtimes = []
+    for path in (manifest.path, manifest.path + "-wal"):
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            pass
+    return max(mtimes, default=None)
+
+
+def write_watch_status(version, mod_status, next_checks):
+    status = {
+        "pid": os.getpid(),
+        "version": version,
+        "updated_at": time.time(),
+        "next_check": min(next_checks.values(), default=None),
+        "mods_with_updates": sorted(s["mod_name"] for s in mod_status.values() if s.get("update")),
+        "mods": mod_status
+    }
+    try:
+        write_cache_file(watch_status_path, status)
+    except OSError as e:
+        message(f"[ERROR]: Could not write {watch_status_path}: {e}")
+
+
+def watch_updates(version):
+
+    if not check_version_exists(version):
+        message("[ERROR]: " + version + " is not a valid Minecraft version")
+        exit()
+
+    message(f"Watching for updates to {version} every {format_duration(watch_interval)}. Results are written to {watch_status_path}")
+
+    global cache_max_ttl
+    cache_max_ttl = watch_interval / 2
+
+    # Only hold the lock on the manifest while saving, so other commands can run meanwhile
+    manifest.unlock()
+    manifest_mtime = get_manifest_mtime()
+    next_checks = {}
+    mod_status = {}
+
+    try:
+        while True:
+
+            # Pick up changes made to mcmm.json by other commands while watching
+            if get_manifest_mtime() != manifest_mtime:
+                load_manifest(shared=True)
+                manifest.unlock()
+                manifest_mtime = get_manifest_mtime()
+                if debug_mode:
+                    message("mcmm.json changed, reloaded the manifest")
+
+            mods = manifest.mods
+            now = time.time()
+
+            # Spread the checks of newly seen mods over the interval, so the APIs see a steady
+            # trickle of requests instead of a burst every interval
+            new_mods = [mod for mod in mods if mod["mod_id"] not in next_checks]
+            for i, mod in enumerate(new_mods):
+                next_checks[mod["mod_id"]] = now + watch_interval * i / len(new_mods)
+            mod_ids = {mod["mod_id"] for mod in mods}
+            for mod_id in list(next_checks):
+                if mod_id not in mod_ids:
+                    del next_checks[mod_id]
+                    mod_status.pop(mod_id, None)
+
+            due_mods = [mod for mod in mods if next_checks[mod["mod_id"]] <= now]
+            if due_mods:
+                # Each mod is checked with its own GET request rather than the bulk hash lookup.
+                # The due mods change from one check to the next, so a bulk request would never
+                # match a cached one, while the cached response for each mod is revalidated with
+                # its ETag and costs a 304 when nothing changed.
+                update_infos = find_updates(due_mods, version, version == manifest["server_version"], mod_hashes={})
+
+                # The manifest may have been changed while the mods were checked
+                manifest.lock()
+                if get_manifest_mtime() != manifest_mtime:
+                    load_manifest()
+                    due_mods = [manifest.find_mod(mod["mod_id"]) for mod in due_mods]
+                checked = [(mod, update_info) for mod, update_info in zip(due_mods, update_infos) if mod]
+                record_updates(manifest, [mod for mod, _ in checked], [update_info for _, update_info in checked])
+                manifest.save()
+                manifest.unlock()
+                manifest_mtime = get_manifest_mtime()
+
+                checked_at = time.time()
+                for mod, update_info in checked:
+                    next_checks[mod["mod_id"]] = checked_at + watch_interval
+                    status = {"mod_name": mod["mod_name"], "checked_at": checked_at}
+                    if isinstance(update_info, APIError):
+                        status["error"] = str(update_info)
+                        status["update"] = mod_status.get(mod["mod_id"], {}).get("update")
+                        message(f"[ERROR]: Could not check {mod['mod_name']}: {update_info}")
+                    elif update_info:
+                        status["update"] = update_info["new_filename"]
+                        if mod_status.get(mod["mod_id"], {}).get("update") != status["update"]:
+                            message(f"Update available for {mod['mod_name']}: {update_info['new_filename']}")
+                    else:
+                        status["update"] = None
+                    mod_status[mod["mod_id"]] = status
+
+                write_watch_status(version, mod_status, next_checks)
+                prune_cache()
+
+            # Sleep until the next mod is due, waking up regularly to notice changes to mcmm.json
+            next_check = min(next_checks.values(), default=time.time() + watch_interval)
+            time.sleep(max(0, min(next_check - time.time(), watch_poll_interval)))
+
+    except KeyboardInterrupt:
+        message("Stopped watching for updates")
+
+
+def format_duration(seconds):
+    if seconds >= 60 * 60 and seconds % (60 * 60) == 0:
+        return f"{int(seconds // (60 * 60))}h"
+    if seconds >= 60:
+        return f"{seconds / 60:g}m"
+    return f"{seconds:g}s"
+
+
+def get_available_game_versions(mods):
+    # Find every Minecraft version each mod has a Fabric release for. Returns a list in the
+    # same order as the mods, with the APIError instead for mods that could not be looked up.
+    from concurrent.futures import ThreadPoolExecutor
+    available = {}
+
+    # CurseForge lists the newest file for each Minecraft version on the mod itself,
+    # so all CurseForge mods can be looked up at once
+    curseforge_mods = [mod for mod in mods if mod["source"] == 'curseforge']
+    if curseforge_mods:
+        try:
+            mod_infos = curseforge_api_call("/v1/mods", {"modIds": [int(mod["mod_id"]) for mod in curseforge_mods]})
+            files_by_mod = {str(mod_info["id"]): mod_info.get("latestFilesIndexes", [])
+                            for mod_info in (mod_infos or {}).get("data", [])}
+            for mod in curseforge_mods:
+                available[id(mod)] = {f["gameVersion"] for f in files_by_mod.get(mod["mod_id"], [])
+                                      if f.get("modLoader") == 4}
+        except APIError as e:
+            for mod in curseforge_mods:
+                available[id(mod)] = e
+
+    # Modrinth needs one request per mod for its full version list
+    def get_modrinth_game_versions(mod):
+        try:
+            mod_versions = modrinth_api_call(f'/project/{mod["mod_id"]}/version?loaders=["fabric"]')
+        except APIError as e:
+            return e
+        return {game_version for mod_version in mod_versions or [] for game_version in mod_version["game_versions"]}
+
+    modrinth_mods = [mod for mod in mods if mod["source"] == 'modrinth']
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        for mod, game_versions_found in zip(modrinth_mods, executor.map(get_modrinth_game_versions, modrinth_mods)):
+            available[id(mod)] = game_versions_found
+
+    return [available.get(id(mod), set()) for mod in mods]
+
+
+def get_version_sort_key(version):
+    return tuple(int(part) if part.isdigit() else -1 for part in version.split("."))
+
+
+def plan_upgrade(versions):
+
+    versions = [v.strip() for v in versions.split(",") if v.strip()]
+    for version in versions:
+        if not check_version_exists(version):
+            message("[ERROR]: " + version + " is not a valid Minecraft version")
+            exit()
+
+    # Nothing here is written back to mcmm.json, so planning never touches pending updates
+    mods = manifest.mods
+    if not mods:
+        message("No mods are installed")
+        return
+
+    available = get_available_game_versions(mods)
+
+    name_width = max([len("Available")] + [len(mod["mod_name"]) for mod in mods])
+    column_width = max([len(f"{len(mods)}/{len(mods)}")] + [len(version) for version in versions])
+
+    def format_row(name, cells):
+        return (name.ljust(name_width) + "".join("  " + cell.ljust(column_width) for cell in cells)).rstrip()
+
+    message()
+    message(format_row("Mod", versions))
+    mods_not_checked = []
+    for mod, game_versions_found in zip(mods, available):
+        if isinstance(game_versions_found, APIError):
+            mods_not_checked.append(mod["mod_name"])
+            cells = ["?" for version in versions]
+        else:
+            cells = ["yes" if version in game_versions_found else "-" for version in versions]
+        message(format_row(mod["mod_name"], cells))
+
+    missing_mods = {version: [mod["mod_name"] for mod, game_versions_found in zip(mods, available)
+                              if not isinstance(game_versions_found, APIError) and version not in game_versions_found]
+                    for version in versions}
+    message(format_row("Available", [f"{len(mods) - len(mods_not_checked) - len(missing_mods[version])}/{len(mods)}"
+                                     for version in versions]))
+    message()
+
+    if mods_not_checked:
+        message("Could not check (try again later):")
+        for mod in mods_not_checked:
+            message(mod)
+        message()
+
+    # Recommend the version that keeps the most mods, preferring the newest one on a tie
+    target = max(versions, key=lambda version: (-len(missing_mods[version]), get_version_sort_key(version)))
+    if missing_mods[target]:
+        message(f"Recommended target: {target} ({len(missing_mods[target])} mods not available: "
+                + ", ".join(missing_mods[target]) + ")")
+    else:
+        message(f"Recommended target: {target} (all checked mods are available)")
+    message()
+
+
+def load_fleet(server_roots):
+    # Load the manifest of every server. Returns a list of (root, manifest) pairs.
+    import sqlite3
+    servers = []
+    for root in server_roots.split(","):
+        root = root.strip()
+        if not root:
+            continue
+        try:
+            servers.append((root, open_manifest(root)))
+        except (OSError, ValueError, sqlite3.Error) as e:
+            message(f"[ERROR]: Could not load the manifest of {root}: {e}")
+    return servers
+
+
+def check_fleet_updates(server_roots, version=None):
+    # Check every server for updates to the given Minecraft version, or to its own server version
+    # if none is given. Mods shared between servers are only looked up once per Minecraft version.
+    global curseforge_api_key
+
+    servers = load_fleet(server_roots)
+    if not servers:
+        message("[ERROR]: No servers to check")
+        exit()
+
+    if version and not check_version_exists(version):
+        message("[ERROR]: " + version + " is not a valid Minecraft version")
+        exit()
+
+    # Any server's CurseForge API key works for the whole fleet
+    api_key_set = False
+    for root, server_manifest in servers:
+        if "curseforge_api_key" in server_manifest:
+            curseforge_api_key = server_manifest["curseforge_api_key"]
+            api_key_set = True
+            break
+
+    targets = {}
+    for root, server_manifest in servers:
+        target_version = version or server_manifest.data.get("server_version")
+        if not target_version:
+            message(f"[ERROR]: Server version not set for {root}, skipping it")
+            continue
+        if any(mod["source"] == 'curseforge' for mod in server_manifest.mods) and not api_key_set:
+            message(f"[ERROR]: Curseforge API key not set for {root}, skipping it")
+            continue
+        targets[root] = target_version
+
+    # Collect one lookup per mod and Minecraft version. Any file hash of a Modrinth project
+    # identifies it, so the hash stored with the first server's record is used for the bulk lookup.
+    lookups = {}
+    lookup_hashes = {}
+    for root, server_manifest in servers:
+        if root not in targets:
+            continue
+        for mod in server_manifest.mods:
+            key = (mod["source"], mod["mod_id"], targets[root])
+            if key not in lookups:
+                lookups[key] = mod
+                if mod["source"] == 'modrinth':
+                    lookup_hashes[id(mod)] = mod.get("hashes", {}).get("sha1")
+
+    results = {}
+    for target_version in sorted(set(targets.values())):
+        version_mods = [mod for key, mod in lookups.items() if key[2] == target_version]
+        update_infos = find_updates(version_mods, target_version, False, lookup_hashes)
+        for mod, update_info in zip(version_mods, update_infos):
+            results[(mod["source"], mod["mod_id"], target_version)] = update_info
+
+    total_mods = 0
+    for root, server_manifest in servers:
+        if root not in targets:
+            continue
+        target_version = targets[root]
+        mods = server_manifest.mods
+        total_mods += len(mods)
+
+        update_infos = []
+        for mod in mods:
+            update_info = results[(mod["source"], mod["mod_id"], target_version)]
+            # On the server's own version, the newest version is only an update if it is not
+            # the one that is already installed
+            if (update_info and not isinstance(update_info, APIError)
+                    and target_version == server_manifest.data.get("server_version")
+                    and update_info["new_version_id"] == mod["mod_version_id"]):
+                update_info = None
+            update_infos.append(update_info)
+
+        record_updates(server_manifest, mods, update_infos)
+        try:
+            server_manifest.save()
+        except OSError as e:
+            message(f"[ERROR]: Could not save the manifest of {root}: {e}")
+
+        mods_with_updates = [mod["mod_name"] for mod, update_info in zip(mods, update_infos)
+                             if update_info and not isinstance(update_info, APIError)]
+        mods_not_checked = [mod["mod_name"] for mod, update_info in zip(mods, update_infos)
+                            if isinstance(update_info, APIError)]
+
+        message()
+        message(f"{root} ({target_version}): {len(mods_with_updates)} of {len(mods)} mods have updates")
+        for mod in mods_with_updates:
+            message("    " + mod)
+        if mods_not_checked:
+            message("Could not check (try again later):")
+            for mod in mods_not_checked:
+                message("    " + mod)
+
+    message()
+    message(f"Checked {total_mods} mods on {len(targets)} servers with {len(lookups)} unique lookups")
+    message()
+
 
 def check_pending_updates(version):
 
     pending_updates = 0
 
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-        mods = data["mods"]
-
-    for mod in mods:
+    for mod in manifest.mods:
         if "update" in mod:
             if mod["update"]["new_version"] == version:
                 pending_updates += 1
@@ -426,19 +2053,79 @@ def check_pending_updates(version):
     return pending_updates
 
 
-def remove_mods_without_updates():
+@profiled("staging")
+def stage_mods_folder(excluded_filenames):
+    # Link everything in the mods folder into the staging folder, except the files that
+    # are being replaced or removed. Files that were already downloaded are kept.
+    for filename in os.listdir("mods"):
+        if filename in excluded_filenames:
+            continue
+        source_path = os.path.join("mods", filename)
+        staged_path = os.path.join(mods_staging_dir, filename)
+        if os.path.exists(staged_path):
+            continue
+        if os.path.isdir(source_path):
+            shutil.copytree(source_path, staged_path, copy_function=link_file)
+        else:
+            link_file(source_path, staged_path)
+
+
+def folder_matches_manifest(directory):
+    # Whether every mod in the manifest has its file, with the recorded hash, in the folder
+    for mod in manifest.mods:
+        path = os.path.join(directory, mod["filename"])
+        if not os.path.isfile(path):
+            return False
+        if mod.get("hashes", {}).get("sha1") and generate_file_sha1_hash(path) != mod["hashes"]["sha1"]:
+            return False
+    return True
+
+
+def remove_mods_backup():
+    # Delete the old mods folder and release the files that were only in it from the jar store
+    released = []
+    if store_dir:
+        for filename in os.listdir(mods_backup_dir):
+            path = os.path.join(mods_backup_dir, filename)
+            current_path = os.path.join("mods", filename)
+            if not os.path.isfile(path):
+                continue
+            if os.path.exists(current_path) and os.path.samefile(path, current_path):
+                continue
+            released.append((filename, {"sha1": generate_file_sha1_hash(path)}))
 
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-        mods = data["mods"]
+    shutil.rmtree(mods_backup_dir)
+    for filename, hashes in released:
+        release_stored_file(filename, hashes)
 
-    mods_without_updates = []
-    for mod in mods:
-        if "update" not in mod:
-            mods_without_updates.append(mod["mod_slug"])
 
-    for mod_slug in mods_without_updates:
-        remove_mod(mod_slug)
+def recover_mods_folder():
+    # Finish or undo an update that was interrupted while the folders were being swapped
+    if not os.path.exists(mods_backup_dir):
+        return
+
+    if not os.path.exists("mods"):
+        os.rename(mods_backup_dir, "mods")
+        message("Restored the mods folder from an interrupted update")
+
+    elif folder_matches_manifest("mods"):
+        # The update finished, but the old folder was never deleted
+        remove_mods_backup()
+
+    elif folder_matches_manifest(mods_backup_dir):
+        # The folders were swapped but the manifest was never saved, so put the old mods back.
+        # The new files are staged again, so the next update doesn't download them again.
+        if os.path.exists(mods_staging_dir):
+            shutil.rmtree(mods_staging_dir)
+        os.rename("mods", mods_staging_dir)
+        os.rename(mods_backup_dir, "mods")
+        message("Restored the mods folder from an interrupted update")
+
+    else:
+        # The manifest describes neither folder, so keep both and move the old one out of the way
+        rotated_dir = f"{mods_backup_dir}.{time.strftime('%Y%m%d%H%M%S')}"
+        os.rename(mods_backup_dir, rotated_dir)
+        message(f"Moved the mods folder of an interrupted update to {rotated_dir}")
 
 
 def update_mods(version):
@@ -452,137 +2139,603 @@ def update_mods(version):
         message("\nThere are no pending updates.\nCheck for updates by using the -c flag.\nSee usage (-h) for more information.\n")
         sys.exit()
 
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-        mods = data["mods"]
-        server_version = data["server_version"]
-
-        # Only need to remove mods without updates if we are upgrading to a newer server version,
-        # as that would lead to mod files for different versions of Minecraft
-        if server_version != version and pending_updates < len(mods):
-
-            confirmation = input(
-                "\nAny mods that do not have pending updates will be removed. Do you want to proceed? (yes/no): ")
-
-            if confirmation.lower() != "yes":
-                sys.exit()
-
-            remove_mods_without_updates()
-
-        for mod in mods:
-            if "update" in mod:
-
-                # Remove old file
-                os.remove(os.path.join("mods", mod["filename"]))
+    server_version = manifest["server_version"]
+    mods_to_remove = []
+
+    # Only need to remove mods without updates if we are upgrading to a newer server version,
+    # as that would lead to mod files for different versions of Minecraft
+    if server_version != version and pending_updates < len(manifest.mods):
+
+        confirmation = input(
+            "\nAny mods that do not have pending updates will be removed. Do you want to proceed? (yes/no): ")
+
+        if confirmation.lower() != "yes":
+            sys.exit()
+
+        mods_to_remove = [mod for mod in manifest.mods if "update" not in mod]
+
+    mods_to_update = [mod for mod in manifest.mods if "update" in mod]
+
+    # Work out which new dependencies the updated versions need
+    dependencies = []
+    if install_dependencies:
+        updated_mods = []
+        for mod in mods_to_update:
+            updated_mod = dict(mod, mod_version_id=mod["update"]["new_version_id"])
+            updated_mod["dependencies"] = mod["update"].get("new_dependencies")
+            updated_mods.append(updated_mod)
+        dependencies = resolve_dependencies(updated_mods, version, mods_to_remove)
+
+    recover_mods_folder()
+    os.makedirs("mods", exist_ok=True)
+
+    # A failed update leaves its downloads in the staging folder. Keep the new files that are
+    # still needed and match their expected hash, as well as partial downloads, and clear
+    # out everything else.
+    os.makedirs(mods_staging_dir, exist_ok=True)
+    new_files = {mod["update"]["new_filename"]: mod["update"].get("new_hashes", {})
+                 for mod in mods_to_update}
+    new_files.update({mod["filename"]: mod["hashes"] for mod in dependencies})
+    for filename in os.listdir(mods_staging_dir):
+        path = os.path.join(mods_staging_dir, filename)
+        if filename.endswith(".part"):
+            continue
+        if filename in new_files and new_files[filename].get("sha1") == generate_file_sha1_hash(path):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    # Download all of the new files into the staging folder. Nothing is changed unless every
+    # download succeeds, and the next attempt picks up where this one stopped.
+    downloads = [(mod["update"]["new_download_url"], mod["update"]["new_filename"], mod["update"].get("new_hashes"))
+                 for mod in mods_to_update]
+    downloads += [(mod["download_url"], mod["filename"], mod["hashes"]) for mod in dependencies]
+    failed = download_mods([download for download in downloads
+                            if not os.path.exists(os.path.join(mods_staging_dir, download[1]))],
+                           mods_staging_dir)
+
+    if failed:
+        message("[ERROR]: No mods were updated because some downloads failed. Run the update again to retry.")
+        return
 
-                # Download new file
-                download_mod(mod["update"]["new_download_url"],
-                             mod["update"]["new_filename"])
+    # Build the complete new mods folder next to the current one
+    replaced_files = [(mod["filename"], mod.get("hashes")) for mod in mods_to_update
+                      if mod["filename"] != mod["update"]["new_filename"]]
+    removed_files = [(mod["filename"], mod.get("hashes")) for mod in mods_to_remove]
+    stage_mods_folder({filename for filename, hashes in replaced_files + removed_files})
+
+    # An update can keep the filename but still replace the jar, so the store copies to release
+    # are picked by hash
+    released_files = [(mod["filename"], mod.get("hashes")) for mod in mods_to_update
+                      if (mod.get("hashes") or {}).get("sha1") != (mod["update"].get("new_hashes") or {}).get("sha1")]
+    released_files += removed_files
+
+    # Swap the folders, then save the manifest. If anything goes wrong, the old folder is put
+    # back and the manifest on disk is left as it was. If the process dies before the manifest
+    # is saved, recover_mods_folder puts the old folder back on the next update.
+    try:
+        os.rename("mods", mods_backup_dir)
+        os.rename(mods_staging_dir, "mods")
+        try:
+            for mod in mods_to_remove:
+                manifest.remove_mod(mod)
+
+            for mod in mods_to_update:
 
                 # Copy 'update' data to primary data variables
                 mod["mod_version_id"] = mod["update"]["new_version_id"]
                 mod["filename"] = mod["update"]["new_filename"]
                 mod["download_url"] = mod["update"]["new_download_url"]
                 mod["current_version"] = mod["update"]["new_version"]
+                mod["hashes"] = mod["update"].get("new_hashes", {})
+                if mod["update"].get("new_dependencies") is not None:
+                    mod["dependencies"] = mod["update"]["new_dependencies"]
+                else:
+                    mod.pop("dependencies", None)
 
                 # Remove pending update data
                 del mod["update"]
 
-                message(mod["mod_name"] + " has been updated")
+            for mod in dependencies:
+                manifest.add_mod(mod)
+
+            # The version was already validated above, so it can be stored directly
+            manifest["server_version"] = version
+            manifest.save()
+        except BaseException:
+            os.rename("mods", mods_staging_dir)
+            raise
+    except BaseException:
+        if os.path.exists(mods_backup_dir) and not os.path.exists("mods"):
+            os.rename(mods_backup_dir, "mods")
+        message("[ERROR]: The update failed and the previous mods have been restored")
+        raise
+
+    # The manifest is saved, so the old files are no longer in use. If they can't be deleted
+    # now, the next update does it.
+    try:
+        shutil.rmtree(mods_backup_dir)
+    except OSError as e:
+        message(f"Could not delete {mods_backup_dir} ({e}), it will be removed by the next update")
+    else:
+        for filename, hashes in released_files:
+            release_stored_file(filename, hashes)
 
-    with open("mcmm.json", "w") as file:
-        json.dump(data, file, indent=4)
+    for mod in mods_to_remove:
+        message(f"Successfully removed {mod['mod_name']}")
 
-    set_server_version(version)
+    for mod in mods_to_update:
+        message(mod["mod_name"] + " has been updated")
 
+    for mod in dependencies:
+        message(mod["mod_name"] + " installed as a dependency")
 
-def list_mods():
 
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-        mods = data["mods"]
+def list_mods():
 
     message()
     message("Installed Mods:")
 
-    for mod in mods:
+    for mod in manifest.mods:
         message(mod["mod_name"])
 
     message()
 
 
-def generate_file_sha1_hash(file_path):
+def hash_file(file_path):
+    import hashlib
     sha1_hash = hashlib.sha1()
+    sha512_hash = hashlib.sha512()
     with open(file_path, 'rb') as file:
-        for chunk in iter(lambda: file.read(4096), b''):
-            sha1_hash.update(chunk)
-    return sha1_hash.hexdigest()
+        # Map the file into memory, so it is hashed in one pass without copying it into
+        # Python. hashlib releases the GIL for large buffers, so files hash in parallel.
+        if os.fstat(file.fileno()).st_size > 0:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                sha1_hash.update(data)
+                sha512_hash.update(data)
+    return {"sha1": sha1_hash.hexdigest(), "sha512": sha512_hash.hexdigest()}
+
+
+def generate_file_sha1_hash(file_path):
+    return hash_file(file_path)["sha1"]
+
+
+def load_hash_index():
+    global hash_index
+    if hash_index is None:
+        hash_index = read_cache_file(hash_index_path) or {}
+    return hash_index
+
+
+@profiled("hashing")
+def get_file_hashes(file_paths):
+    # Returns the SHA1 and SHA512 hashes of each file. Files are only hashed if they are not in
+    # the index yet or their size, modification time or inode changed since they were hashed.
+    from concurrent.futures import ThreadPoolExecutor
+    index = load_hash_index()
+    file_hashes = {}
+    files_to_hash = []
+
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        key = os.path.normpath(file_path)
+        signature = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        entry = index.get(key)
+        if entry and entry["signature"] == signature:
+            file_hashes[file_path] = entry["hashes"]
+            profile_count("hash_index_hits")
+        else:
+            files_to_hash.append((file_path, key, signature))
+
+    if not files_to_hash:
+        return file_hashes
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        hashes = executor.map(hash_file, [file_path for file_path, key, signature in files_to_hash])
+        for (file_path, key, signature), file_hash in zip(files_to_hash, hashes):
+            file_hashes[file_path] = file_hash
+            index[key] = {"signature": signature, "hashes": file_hash}
+            profile_count("files_hashed")
+            profile_count("bytes_hashed", signature[0])
+
+    # Forget about files that no longer exist before saving the index
+    for key in [key for key in index if not os.path.exists(key)]:
+        del index[key]
+
+    try:
+        write_cache_file(os.path.abspath(hash_index_path), index)
+    except OSError as e:
+        if debug_mode:
+            message(f"Could not save the hash index: {e}")
+
+    return file_hashes
 
 
 def import_mods():
-    # Iterate over all mods in the mods folder
-    for filename in os.listdir('./mods/'):
-        file_path = os.path.join('./mods/', filename)
-        if os.path.isfile(file_path) and file_path.endswith('.jar'):
+    # Hash all of the mods in the mods folder
+    file_paths = [os.path.join('./mods/', filename) for filename in os.listdir('./mods/')]
+    file_paths = [path for path in file_paths if os.path.isfile(path) and path.endswith('.jar')]
 
-            # Get the hash of the function and use it to check the modrinth api
-            sha1_hash = generate_file_sha1_hash(file_path)
-            mod_info = modrinth_api_call('/version_file/' + sha1_hash)
+    file_hashes = get_file_hashes(file_paths)
+    file_hashes = [file_hashes[path]["sha1"] for path in file_paths]
 
-            if mod_info == None:
-                message('Could not identify the mod at ' + file_path)
-            else:
+    # Identify all of the files with the modrinth api at once
+    versions = modrinth_bulk_api_call('/version_files', sorted(set(file_hashes)))
+    if versions is None:
+        message("[ERROR]: Could not look up the mods on Modrinth")
+        return
 
-                # If mod is found, get relevant info
-                mod_id = mod_info["project_id"]
-                mod_version_id = mod_info["id"]
-                download_url = mod_info["files"][0]["url"]
-                current_version = mod_info["game_versions"][0]
-                source = "modrinth"
+    projects = get_modrinth_projects(sorted({v["project_id"] for v in versions.values()}))
+    if projects is None:
+        message("[ERROR]: Could not look up the mods on Modrinth")
+        return
+    projects = {project["id"]: project for project in projects}
 
-                more_mod_info = modrinth_api_call('/project/' + mod_id)
-                mod_name = more_mod_info["title"]
-                mod_slug = more_mod_info["slug"]
 
-                # Check if mod is already documented
-                if check_mod_exists(mod_id):
-                    message(mod_name + " is already installed")
-                else:
+    for file_path, sha1_hash in zip(file_paths, file_hashes):
+
+        mod_info = versions.get(sha1_hash)
+
+        # A version can have several files (like sources jars), so find the one that is
+        # actually in the mods folder and record its URL and hashes together
+        mod_file = None
+        if mod_info is not None:
+            mod_file = next((f for f in mod_info["files"] if f["hashes"].get("sha1") == sha1_hash), None)
+
+        if mod_file is None or mod_info["project_id"] not in projects:
+            message('Could not identify the mod at ' + file_path)
+            continue
+
+        # If mod is found, get relevant info
+        mod_id = mod_info["project_id"]
+        mod_version_id = mod_info["id"]
+        download_url = mod_file["url"]
+        current_version = mod_info["game_versions"][0]
+        source = "modrinth"
+        hashes = get_modrinth_file_hashes(mod_file)
+
+        more_mod_info = projects[mod_id]
+        mod_name = more_mod_info["title"]
+        mod_slug = more_mod_info["slug"]
+
+        # Check if mod is already documented
+        if check_mod_exists(mod_id):
+            message(mod_name + " is already installed")
+            continue
+
+        # Add mod info to json
+        new_mod = {
+            "mod_name": mod_name,
+            "mod_slug": mod_slug,
+            "mod_id": mod_id,
+            "mod_version_id": mod_version_id,
+            "filename": os.path.basename(file_path),
+            "download_url": download_url,
+            "hashes": hashes,
+            "current_version": current_version,
+            "source": source
+        }
+
+        manifest.add_mod(new_mod)
+
+        message(mod_name + " has been imported")
+
+    # Save all of the imported mods at once
+    manifest.save()
+
+
+def write_lockfile():
+    # Pin the file that is actually in the mods folder for every mod
+    mods = manifest.mods
+    file_paths = {mod["mod_id"]: os.path.join("mods", mod["filename"]) for mod in mods}
+    missing = [mod for mod in mods if not os.path.isfile(file_paths[mod["mod_id"]])]
+    for mod in missing:
+        message(f"[ERROR]: {mod['filename']} is not in the mods folder, so {mod['mod_name']} can't be locked")
+
+    present = [mod for mod in mods if os.path.isfile(file_paths[mod["mod_id"]])]
+    file_hashes = get_file_hashes([file_paths[mod["mod_id"]] for mod in present])
+
+    locked_mods = []
+    for mod in present:
+        file_path = file_paths[mod["mod_id"]]
+        locked_mods.append({
+            "mod_name": mod["mod_name"],
+            "mod_id": mod["mod_id"],
+            "source": mod["source"],
+            "filename": mod["filename"],
+            "url": mod["download_url"],
+            "size": os.path.getsize(file_path),
+            "sha512": file_hashes[file_path]["sha512"],
+            "sha1": file_hashes[file_path]["sha1"]
+        })
+    locked_mods.sort(key=lambda mod: mod["filename"])
+
+    lock = {"server_version": manifest.data.get("server_version"), "mods": locked_mods}
+    temp_path = lockfile_path + ".tmp"
+    with open(temp_path, "w") as file:
+        json.dump(lock, file, indent=4)
+    os.replace(temp_path, lockfile_path)
+
+    message(f"Locked {len(locked_mods)} mods in {lockfile_path}")
+
+
+def restore_mods():
+    # Rebuild the mods folder from the lockfile alone. Files that already match are kept,
+    # everything else is downloaded (or linked from the jar store) and verified.
+    try:
+        with open(lockfile_path, "r") as file:
+            lock = json.load(file)
+    except (OSError, ValueError) as e:
+        message(f"[ERROR]: Could not read {lockfile_path}: {e}")
+        sys.exit(1)
+
+    os.makedirs("mods", exist_ok=True)
+
+    # Only files with the right size need to be hashed to know whether they match
+    candidates = [mod for mod in lock["mods"]
+                  if os.path.isfile(os.path.join("mods", mod["filename"]))
+                  and os.path.getsize(os.path.join("mods", mod["filename"])) == mod["size"]]
+    file_hashes = get_file_hashes([os.path.join("mods", mod["filename"]) for mod in candidates])
+    matching = {mod["filename"] for mod in candidates
+                if file_hashes[os.path.join("mods", mod["filename"])]["sha512"] == mod["sha512"]}
+
+    downloads = [(mod["url"], mod["filename"], {"sha1": mod["sha1"], "sha512": mod["sha512"]})
+                 for mod in lock["mods"] if mod["filename"] not in matching]
+
+    # Replace files that don't match instead of resuming into them
+    for url, filename, hashes in downloads:
+        if os.path.exists(os.path.join("mods", filename)):
+            os.remove(os.path.join("mods", filename))
+
+    failed = download_mods(downloads)
+
+    locked_filenames = {mod["filename"] for mod in lock["mods"]}
+    for filename in sorted(os.listdir("mods")):
+        if filename.endswith(".jar") and filename not in locked_filenames:
+            message(f"{filename} is not in {lockfile_path}")
+
+    message(f"{len(matching)} mods were already in place, {len(downloads) - len(failed)} restored")
+    if failed:
+        sys.exit(1)
+
+
+def open_catalog(create=False):
+    # Returns the connection to the catalog, or None if it hasn't been synced yet
+    global catalog
+    if catalog is not None:
+        return catalog
+
+    import sqlite3
+    path = os.path.join(cache_dir, catalog_filename)
+    if not create and not os.path.exists(path):
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+
+    connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.execute("CREATE TABLE IF NOT EXISTS catalog_settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    connection.execute("CREATE TABLE IF NOT EXISTS projects (project_id TEXT PRIMARY KEY, slug TEXT NOT NULL, "
+                       "title TEXT NOT NULL, description TEXT NOT NULL, downloads INTEGER NOT NULL, "
+                       "date_modified TEXT NOT NULL, synced_at REAL NOT NULL)")
+    connection.execute("CREATE INDEX IF NOT EXISTS projects_by_slug ON projects (slug)")
+    connection.execute("CREATE INDEX IF NOT EXISTS projects_by_title ON projects (title COLLATE NOCASE)")
+
+    # Full-text indexes over the projects table: words for search, and the trigrams of each
+    # slug for finding slugs that are close to a mistyped one. Triggers keep them up to date.
+    try:
+        connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS projects_text USING fts5(slug, title, description, "
+                           "content='projects', content_rowid='rowid')")
+        connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS projects_slugs USING fts5(slug, "
+                           "content='projects', content_rowid='rowid', tokenize='trigram')")
+    except sqlite3.OperationalError as e:
+        connection.close()
+        message(f"[ERROR]: The mod catalog needs SQLite 3.34 or newer with FTS5: {e}")
+        sys.exit(1)
+    connection.execute("""CREATE TRIGGER IF NOT EXISTS projects_inserted AFTER INSERT ON projects BEGIN
+        INSERT INTO projects_text (rowid, slug, title, description) VALUES (new.rowid, new.slug, new.title, new.description);
+        INSERT INTO projects_slugs (rowid, slug) VALUES (new.rowid, new.slug);
+    END""")
+    connection.execute("""CREATE TRIGGER IF NOT EXISTS projects_deleted AFTER DELETE ON projects BEGIN
+        INSERT INTO projects_text (projects_text, rowid, slug, title, description) VALUES ('delete', old.rowid, old.slug, old.title, old.description);
+        INSERT INTO projects_slugs (projects_slugs, rowid, slug) VALUES ('delete', old.rowid, old.slug);
+    END""")
+    connection.execute("""CREATE TRIGGER IF NOT EXISTS projects_updated AFTER UPDATE ON projects BEGIN
+        INSERT INTO projects_text (projects_text, rowid, slug, title, description) VALUES ('delete', old.rowid, old.slug, old.title, old.description);
+        INSERT INTO projects_slugs (projects_slugs, rowid, slug) VALUES ('delete', old.rowid, old.slug);
+        INSERT INTO projects_text (rowid, slug, title, description) VALUES (new.rowid, new.slug, new.title, new.description);
+        INSERT INTO projects_slugs (rowid, slug) VALUES (new.rowid, new.slug);
+    END""")
+
+    catalog = connection
+    return catalog
+
+
+def get_catalog_setting(connection, key):
+    row = connection.execute("SELECT value FROM catalog_settings WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def get_catalog_page(offset):
+    # One page of Fabric mods from the Modrinth search, most recently updated first. Search
+    # results change all the time, so they are never cached.
+    query = urllib.parse.urlencode({
+        "facets": json.dumps([["project_type:mod"], ["categories:fabric"]], separators=(",", ":")),
+        "index": "updated",
+        "offset": offset,
+        "limit": catalog_page_size
+    })
+    url = f"{modrinth_api_url}/search?{query}"
+    response = api_request("GET", url)
+    if response.status_code != 200:
+        raise APIError(f"GET {url} failed: HTTP {response.status_code}")
+    profile_count("catalog_pages")
+    return response.json()
+
+
+def store_catalog_page(connection, hits, synced_at):
+    connection.execute("BEGIN IMMEDIATE")
+    connection.executemany(
+        "INSERT INTO projects (project_id, slug, title, description, downloads, date_modified, synced_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (project_id) DO UPDATE SET slug = excluded.slug, "
+        "title = excluded.title, description = excluded.description, downloads = excluded.downloads, "
+        "date_modified = excluded.date_modified, synced_at = excluded.synced_at",
+        [(hit["project_id"], hit["slug"], hit["title"], hit.get("description") or "", hit.get("downloads", 0),
+          hit.get("date_modified") or "", synced_at) for hit in hits])
+    connection.execute("COMMIT")
+
+
+@profiled("catalog_sync")
+def sync_catalog():
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    if offline_mode:
+        message("[ERROR]: The mod catalog can't be synced in offline mode")
+        sys.exit(1)
+
+    connection = open_catalog(create=True)
+    synced_at = time.time()
+    newest_modified = get_catalog_setting(connection, "newest_modified")
+    full_synced_at = float(get_catalog_setting(connection, "full_synced_at") or 0)
+    full_sync = newest_modified is None or synced_at - full_synced_at > catalog_full_sync_interval
+    start_time = time.monotonic()
+
+    first_page = get_catalog_page(0)
+    total_hits = first_page["total_hits"]
+    hits = first_page["hits"]
+    # Mods updated while the sync runs are newer than this and are picked up by the next one
+    latest_modified = max([hit.get("date_modified") or "" for hit in hits] + [newest_modified or ""])
+    synced = 0
+
+    if full_sync:
+        message(f"Syncing the catalog of {total_hits} Fabric mods from Modrinth")
+        store_catalog_page(connection, hits, synced_at)
+        synced += len(hits)
+        seen = {hit["project_id"] for hit in hits}
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = [executor.submit(get_catalog_page, offset)
+                       for offset in range(catalog_page_size, total_hits, catalog_page_size)]
+            for future in as_completed(futures):
+                page_hits = future.result()["hits"]
+                store_catalog_page(connection, page_hits, synced_at)
+                synced += len(page_hits)
+                seen.update(hit["project_id"] for hit in page_hits)
+
+        # A mod updated during the sync moves to the front and shifts the pages, so another mod
+        # can slip past a page boundary. Only once every mod was seen were the rest removed,
+        # otherwise the next sync is a full one again.
+        connection.execute("BEGIN IMMEDIATE")
+        if len(seen) >= total_hits:
+            removed = connection.execute("DELETE FROM projects WHERE synced_at < ?", (synced_at,)).rowcount
+            connection.execute("INSERT INTO catalog_settings (key, value) VALUES ('full_synced_at', ?) "
+                               "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (str(synced_at),))
+        else:
+            removed = 0
+            message(f"Mods changed on Modrinth during the sync, so only {len(seen)} of {total_hits} were seen. "
+                    f"Removed mods will be pruned by the next sync.")
+    else:
+        # Pages are sorted by when the mods were last updated, so stop at the first mod that
+        # hasn't changed since the previous sync
+        offset = 0
+        while hits:
+            changed = [hit for hit in hits if (hit.get("date_modified") or "") > newest_modified]
+            store_catalog_page(connection, changed, synced_at)
+            synced += len(changed)
+            offset += catalog_page_size
+            if len(changed) < len(hits) or offset >= total_hits:
+                break
+            hits = get_catalog_page(offset)["hits"]
+        removed = 0
+        connection.execute("BEGIN IMMEDIATE")
+
+    connection.execute("INSERT INTO catalog_settings (key, value) VALUES ('newest_modified', ?) "
+                       "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (latest_modified,))
+    connection.execute("COMMIT")
+
+    total = connection.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+    message(f"Synced {synced} mods and removed {removed} in {time.monotonic() - start_time:.2f}s. "
+            f"The catalog has {total} mods.")
+
+
+def get_search_terms(text):
+    return "".join(character if character.isalnum() else " " for character in text.lower()).split()
+
+
+def search_catalog(query, limit=10):
+    connection = open_catalog()
+    if connection is None or get_catalog_setting(connection, "newest_modified") is None:
+        message("[ERROR]: The mod catalog hasn't been synced yet. Run with --sync-catalog first.")
+        sys.exit(1)
+
+    # Every word has to match the start of a word in the slug, title or description. Matches
+    # in the slug count the most and matches in the description the least.
+    terms = get_search_terms(query)
+    results = []
+    if terms:
+        results = connection.execute(
+            "SELECT projects.slug, projects.title, projects.description, projects.downloads "
+            "FROM projects_text JOIN projects ON projects.rowid = projects_text.rowid "
+            "WHERE projects_text MATCH ? ORDER BY bm25(projects_text, 10.0, 5.0, 1.0) LIMIT ?",
+            (" ".join(f'"{term}"*' for term in terms), limit)).fetchall()
+
+    if not results:
+        suggestions = suggest_slugs(query)
+        message(f"No mods found for '{query}'" + (f". Did you mean {' or '.join(suggestions)}?" if suggestions else ""))
+        return
+
+    for slug, title, description, downloads in results:
+        message(f"{title} ({slug}) - {downloads:,} downloads")
+        if description:
+            message(f"    {description}")
+
+
+def find_catalog_slug(name):
+    # Returns the slug of the mod the name refers to, if it isn't a slug or ID already but
+    # matches one once it is written like a slug, or matches the title of exactly one mod
+    connection = open_catalog()
+    if connection is None:
+        return None
+    if connection.execute("SELECT 1 FROM projects WHERE slug = ? OR project_id = ?", (name, name)).fetchone():
+        return None
 
-                    # Add mod info to json
-                    new_mod = {
-                        "mod_name": mod_name,
-                        "mod_slug": mod_slug,
-                        "mod_id": mod_id,
-                        "mod_version_id": mod_version_id,
-                        "filename": filename,
-                        "download_url": download_url,
-                        "current_version": current_version,
-                        "source": source
-                    }
+    slug = "-".join(get_search_terms(name))
+    if slug != name and connection.execute("SELECT 1 FROM projects WHERE slug = ?", (slug,)).fetchone():
+        message(f"Using {slug} for '{name}'")
+        return slug
 
-                    with open("mcmm.json", "r") as file:
-                        data = json.load(file)
-                        mods = data["mods"]
+    matches = connection.execute("SELECT slug FROM projects WHERE title = ? COLLATE NOCASE LIMIT 2", (name,)).fetchall()
+    if len(matches) == 1:
+        message(f"Using {matches[0][0]} for '{name}'")
+        return matches[0][0]
+    return None
 
-                    mods.append(new_mod)
 
-                    with open("mcmm.json", "w") as file:
-                        json.dump(data, file, indent=4)
+def suggest_slugs(slug, limit=3):
+    # Slugs in the catalog that are close to the given one, closest first. Candidates are
+    # the slugs that share the most trigrams with it, so a typo anywhere still finds them.
+    import difflib
+    connection = open_catalog()
+    trigrams = {slug[i:i + 3] for i in range(len(slug) - 2)}
+    trigrams = [trigram for trigram in trigrams if '"' not in trigram]
+    if connection is None or not trigrams:
+        return []
 
-                    message(mod_name + " has been imported")
+    candidates = [row[0] for row in connection.execute(
+        "SELECT projects.slug FROM projects_slugs JOIN projects ON projects.rowid = projects_slugs.rowid "
+        "WHERE projects_slugs MATCH ? ORDER BY rank LIMIT 50",
+        (" OR ".join(f'"{trigram}"' for trigram in trigrams),))]
+    return difflib.get_close_matches(slug, candidates, n=limit, cutoff=0.6)
 
 
 def print_server_version():
-    with open("mcmm.json", "r") as file:
-        data = json.load(file)
-        server_version = data["server_version"]
-        message(server_version)
+    message(manifest["server_version"])
 
 
 def print_usage():
     print('''
-    usage: python mcmm.py [-h] [-a [source] [id_or_slug]] [-c [version]] [-i] [-k [api_key]] [-l] [-r [id_or_slug]] [-s [version]] [-u [version]] [--debug]
+    usage: python mcmm.py [-h] [-a [source] [id_or_slug]] [-c [version]] [-d] [-f [directories]] [-i] [-j [jobs]] [-k [api_key]] [-l] [-p [versions]] [-r [id_or_slug]] [-s [version]] [-u [version]] [-w [version]] [--timeout [seconds]] [--pool-size [connections]] [--no-cache] [--cache-dir [directory]] [--store [directory]] [--offline] [--no-update-check] [--update-check-interval [hours]] [--watch-interval [minutes]] [--no-deps] [--lock] [--restore] [--migrate-sqlite] [--sync-catalog] [--search [query]] [--profile [file]] [--profile-trace [file]] [--debug]
 
     A tool to download, update, and manage mods for your Minecraft server using the Modrinth and CursgeForge APIs.
 
@@ -590,25 +2743,48 @@ def print_usage():
     -------------------------------------------------------------------------------------------------------------------------------------------------
     -a, --add-mod           [Source] [ID|Slug]  Fetch and install the mod with the given ID or slug from the desired source (Modrinth or CurseForge).
     -c, --check-updates     [VERSION]           Check to see if mods have new versions available for specified Minecraft version. 
+    -d, --add-dependencies                      Install any required dependencies of your mods that are missing.
+    -f, --fleet             [DIRECTORIES]       Check the servers in the comma-separated DIRECTORIES for updates to their server version, or to VERSION with -c.
     -h, --help                                  Prints usage.
     -i, --import-mods                           Scan the mods folder and import any mods that not already monitored. (Only works with Modrinth mods)
+    -j, --jobs              [JOBS]              Number of mods to check or download at the same time. (Default: 8)
     -k, --api-key                               Set the API key that is required for CurseForge.
     -l, --list-mods                             Lists all of the mods that are currently installed.
+    -p, --plan              [VERSIONS]          Show which mods are available for each of the comma-separated VERSIONS and recommend one.
     -r, --remove-mod        [ID|Slug|ALL]       Remove the mod with the specified ID or slug.
     -s, --set-version       [VERSION]           Change the stored value of your Minecraft server version to VERSION.
     -u, --update-mods       [VERSION]           Removes any mods without pending updates to the desired version and updates the rest.
     -v, --print-version                         Prints the current version of the server and mods.
+    -w, --watch             [VERSION]           Keep running and check for updates to VERSION on a schedule, writing the results to mcmm.status.json.
+    --timeout               [SECONDS]           Seconds to wait for the APIs or a download to respond. (Default: 30)
+    --pool-size             [CONNECTIONS]       Number of connections kept open to each host. (Default: 16, or JOBS if higher)
+    --no-cache                                  Always ask the APIs instead of using cached responses.
+    --cache-dir             [DIRECTORY]         Where API responses are cached. (Default: ~/.cache/mcmm)
+    --store                 [DIRECTORY]         Share downloaded mod files with other servers through a jar store in DIRECTORY.
+    --offline                                   Validate Minecraft versions against the cached version list without going online.
+    --no-update-check                           Don't check GitHub for new releases of MCModManager.
+    --update-check-interval [HOURS]             How long the result of the check for new releases is reused. (Default: 24)
+    --watch-interval        [MINUTES]           How often each mod is checked in watch mode. (Default: 60)
+    --no-deps                                   Don't install required dependencies when adding or updating mods.
+    --lock                                      Pin the exact file of every mod in mcmm.lock.
+    --restore                                   Rebuild the mods folder from mcmm.lock without using the APIs.
+    --migrate-sqlite                            Move the manifest from mcmm.json into an SQLite database, mcmm.db.
+    --sync-catalog                              Download the catalog of Fabric mods on Modrinth for --search and "did you mean" suggestions.
+    --search                [QUERY]             Search the synced mod catalog without going online.
+    --profile               [FILE]              Write the time spent in each phase, API latencies by endpoint and other counters to FILE as JSON.
+    --profile-trace         [FILE]              Write a cProfile trace of the main thread to FILE.
     --debug                                     Display more information to console. Must be passed as the last argument in your command.
     ''')
 
 
 def interactive_mode():
 
-    init_json_file()
+    check_new_version(timeout=2)
 
-    while True:
+    # Other commands can use the manifest while waiting for input
+    manifest.unlock()
 
-        check_new_version()
+    while True:
 
         print('''\nWhat would you like to do?
     1.  Add mod
@@ -625,6 +2801,9 @@ def interactive_mode():
 
         option = input("Enter the number of the option: ")
 
+        # Load the manifest again in case another command changed it in the meantime
+        load_manifest()
+
         match option:
             case '1':
                 source = input(
@@ -681,12 +2860,10 @@ def interactive_mode():
             case '10':
                 exit()
 
+        manifest.unlock()
 
-def main():
-    check_new_version()
-
-    init_json_file()
 
+def main():
     # Create the argument parser
     parser = argparse.ArgumentParser(
         prog="python mcmm.py",
@@ -697,14 +2874,36 @@ def main():
     parser.add_argument("-a", "--add-mod", nargs=2,
                         metavar=("[source]", "[id_or_slug]"))
     parser.add_argument("-c", "--check-updates", metavar="[version]")
+    parser.add_argument("-d", "--add-dependencies", action="store_true")
+    parser.add_argument("-f", "--fleet", metavar="[directories]")
     parser.add_argument("-h", "--help", action="store_true")
     parser.add_argument("-i", "--import-mods", action="store_true")
+    parser.add_argument("-j", "--jobs", type=int, metavar="[jobs]")
     parser.add_argument("-k", "--api-key", metavar="[api_key]")
     parser.add_argument("-l", "--list-mods", action="store_true")
+    parser.add_argument("-p", "--plan", metavar="[versions]")
     parser.add_argument("-r", "--remove-mod", metavar="[id_or_slug]")
     parser.add_argument("-s", "--set-version", metavar="[version]")
     parser.add_argument("-u", "--update-mods", metavar="[version]")
     parser.add_argument("-v", "--print-version",  action="store_true")
+    parser.add_argument("-w", "--watch", metavar="[version]")
+    parser.add_argument("--watch-interval", type=float, metavar="[minutes]")
+    parser.add_argument("--timeout", type=float, metavar="[seconds]")
+    parser.add_argument("--pool-size", type=int, metavar="[connections]")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--cache-dir", metavar="[directory]")
+    parser.add_argument("--store", metavar="[directory]")
+    parser.add_argument("--offline", action="store_true")
+    parser.add_argument("--no-update-check", action="store_true")
+    parser.add_argument("--update-check-interval", type=float, metavar="[hours]")
+    parser.add_argument("--no-deps", action="store_true")
+    parser.add_argument("--lock", action="store_true")
+    parser.add_argument("--restore", action="store_true")
+    parser.add_argument("--migrate-sqlite", action="store_true")
+    parser.add_argument("--sync-catalog", action="store_true")
+    parser.add_argument("--search", metavar="[query]")
+    parser.add_argument("--profile", metavar="[file]")
+    parser.add_argument("--profile-trace", metavar="[file]")
     parser.add_argument("--debug", action="store_true")
 
     # Parse the arguments from the command line
@@ -714,6 +2913,109 @@ def main():
     global debug_mode
     debug_mode = args.debug
 
+    # Set how many API requests can be in flight at the same time
+    global jobs
+    if args.jobs:
+        jobs = args.jobs
+
+    # Set the network timeout and how many connections are kept open per host
+    global http_timeout, http_pool_size
+    if args.timeout:
+        http_timeout = args.timeout
+    if args.pool_size:
+        http_pool_size = args.pool_size
+
+    # Configure the API response cache
+    global cache_enabled, cache_dir
+    cache_enabled = not args.no_cache
+    if args.cache_dir:
+        cache_dir = args.cache_dir
+
+    # Use a shared jar store if one was given
+    global store_dir
+    if args.store:
+        store_dir = args.store
+
+    # Check if --offline mode is enabled
+    global offline_mode
+    offline_mode = args.offline
+
+    # Check if dependencies should be installed automatically
+    global install_dependencies
+    install_dependencies = not args.no_deps
+
+    # Set how often mods are checked in watch mode
+    global watch_interval
+    if args.watch_interval:
+        watch_interval = args.watch_interval * 60
+
+    # Configure the check for new releases of MCModManager. Commands that only read local files,
+    # or that reproduce a pinned set of mods, don't check, so they never wait for it.
+    global update_check_enabled, update_check_interval
+    local_command = (args.help or args.list_mods or args.print_version or args.search or args.restore
+                     or args.lock or args.migrate_sqlite)
+    update_check_enabled = not args.no_update_check and not local_command
+    if args.update_check_interval is not None:
+        update_check_interval = args.update_check_interval * 60 * 60
+
+    # Record timings and counters for --profile, and trace every call for --profile-trace
+    global profile_path, profile_trace_path, profile_started_at
+    profile_path = args.profile
+    profile_trace_path = args.profile_trace
+    profile_started_at = time.perf_counter()
+    profiler = None
+    if profile_trace_path:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start_new_version_check()
+
+    try:
+        run_command(args)
+    except APIError as e:
+        message(f"[ERROR]: {e}")
+        sys.exit(1)
+    finally:
+        check_new_version()
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_trace_path)
+        if profile_path:
+            write_profile()
+
+
+@profiled("command")
+def run_command(args):
+
+    # Printing the usage doesn't need the manifest
+    if args.help:
+        print_usage()
+        return
+
+    # Fleet checks work on the manifests of other servers, not the one in the current directory
+    if args.fleet:
+        check_fleet_updates(args.fleet, args.check_updates)
+        return
+
+    # Restoring only needs the lockfile, so it works before mcmm.json exists
+    if args.restore:
+        restore_mods()
+        return
+
+    # The mod catalog is kept in the cache directory and doesn't need the manifest
+    if args.sync_catalog:
+        sync_catalog()
+        return
+    if args.search:
+        search_catalog(args.search)
+        return
+
+    init_json_file()
+
+    # Commands that only read the manifest share it, everything else waits for sole access
+    load_manifest(shared=bool(args.list_mods or args.print_version or args.plan or args.lock))
+
     # Check which command was invoked and execute the corresponding function
     if args.add_mod:
         # Init API key only if needed
@@ -725,8 +3027,13 @@ def main():
         init_api_key("check")
         init_server_version()
         check_updates(args.check_updates)
-    elif args.help:
-        print_usage()
+    elif args.add_dependencies:
+        init_api_key("check")
+        init_server_version()
+        add_missing_dependencies()
+    elif args.plan:
+        init_api_key("check")
+        plan_upgrade(args.plan)
     elif args.import_mods:
         import_mods()
     elif args.api_key:
@@ -742,6 +3049,14 @@ def main():
         update_mods(args.update_mods)
     elif args.print_version:
         print_server_version()
+    elif args.lock:
+        write_lockfile()
+    elif args.migrate_sqlite:
+        migrate_to_sqlite()
+    elif args.watch:
+        init_api_key("check")
+        init_server_version()
+        watch_updates(args.watch)
     else:
         # If no argument was provided or unrecognized argument, enter interactive mode
         interactive_mode()
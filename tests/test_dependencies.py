@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mcmm
+
+
+def new_mod(mod_id, dependencies):
+    return {"mod_name": "Mod " + mod_id, "mod_slug": mod_id.lower(), "mod_id": mod_id, "mod_version_id": "V" + mod_id,
+            "filename": mod_id + ".jar", "download_url": "", "hashes": {}, "current_version": "1.21",
+            "source": "modrinth", "dependencies": dependencies}
+
+
+class DependencyCycleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.temp_dir.name)
+        with open("mcmm.json", "w") as file:
+            json.dump({"server_version": "1.21", "mods": []}, file)
+        mcmm.load_manifest()
+
+    def tearDown(self):
+        mcmm.manifest.unlock()
+        mcmm.manifest = None
+        os.chdir(self.original_dir)
+        self.temp_dir.cleanup()
+
+    def test_cycle_is_installed_and_reported(self):
+        # A depends on B, which depends on A again
+        mod_a = new_mod("A", ["B"])
+        lookups = []
+
+        def resolve_mods(source, slugs_or_ids, server_version):
+            lookups.append(list(slugs_or_ids))
+            return {slug_or_id: new_mod(slug_or_id, ["A"]) for slug_or_id in slugs_or_ids if slug_or_id == "B"}, {}
+
+        with mock.patch.object(mcmm, "get_mod_dependencies", return_value={"A": ["B"]}), \
+                mock.patch.object(mcmm, "resolve_mods", side_effect=resolve_mods), \
+                mock.patch.object(mcmm, "message") as message:
+            new_mods = mcmm.resolve_dependencies([mod_a], "1.21")
+
+        self.assertEqual([mod["mod_id"] for mod in new_mods], ["B"])
+        self.assertEqual(lookups, [["B"]])
+        message.assert_any_call("Found a dependency cycle: Mod A -> Mod B -> Mod A")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+mcmm_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcmm.py")
+
+jars = {f"mod-{i}.jar": os.urandom(64 * 1024) for i in range(4)}
+
+
+class SlowJarHandler(BaseHTTPRequestHandler):
+    # Sends each jar in small pieces so downloads of the same file overlap
+
+    def do_GET(self):
+        content = jars.get(self.path.lstrip("/"))
+        if content is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        for i in range(0, len(content), 8 * 1024):
+            self.wfile.write(content[i:i + 8 * 1024])
+            self.wfile.flush()
+            time.sleep(0.05)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ConcurrentStoreDownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SlowJarHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store_dir = os.path.join(self.temp_dir.name, "store")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def make_server_dir(self, name):
+        server_dir = os.path.join(self.temp_dir.name, name)
+        os.makedirs(server_dir)
+        mods = [{"mod_name": filename, "mod_id": filename, "source": "modrinth", "filename": filename,
+                 "url": f"http://127.0.0.1:{self.server.server_port}/{filename}", "size": len(content),
+                 "sha512": hashlib.sha512(content).hexdigest(), "sha1": hashlib.sha1(content).hexdigest()}
+                for filename, content in jars.items()]
+        with open(os.path.join(server_dir, "mcmm.lock"), "w") as file:
+            json.dump({"server_version": "1.21", "mods": mods}, file)
+        return server_dir
+
+    def test_two_restores_into_one_store(self):
+        server_dirs = [self.make_server_dir("server-1"), self.make_server_dir("server-2")]
+        env = dict(os.environ, MCMM_CACHE_DIR=os.path.join(self.temp_dir.name, "cache"))
+        processes = [subprocess.Popen([sys.executable, mcmm_path, "--restore", "--store", self.store_dir,
+                                       "--no-update-check"], cwd=server_dir, env=env,
+                                      stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+                     for server_dir in server_dirs]
+
+        for process in processes:
+            output = process.communicate(timeout=60)[0]
+            self.assertEqual(process.returncode, 0, output)
+
+        for server_dir in server_dirs:
+            for filename, content in jars.items():
+                with open(os.path.join(server_dir, "mods", filename), "rb") as file:
+                    self.assertEqual(file.read(), content)
+
+        leftovers = [filename for _, _, filenames in os.walk(self.store_dir)
+                     for filename in filenames if filename.endswith(".part")]
+        self.assertEqual(leftovers, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
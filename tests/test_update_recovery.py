@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mcmm
+
+
+class UpdateRecoveryTest(unittest.TestCase):
+    # Each test leaves the folders the way an update interrupted at some point would
+
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.temp_dir.name)
+
+    def tearDown(self):
+        if mcmm.manifest:
+            mcmm.manifest.unlock()
+        mcmm.manifest = None
+        os.chdir(self.original_dir)
+        self.temp_dir.cleanup()
+
+    def write_mods(self, directory, contents):
+        os.makedirs(directory)
+        for filename, content in contents.items():
+            with open(os.path.join(directory, filename), "wb") as file:
+                file.write(content)
+
+    def load_manifest(self, contents):
+        mods = [{"mod_name": filename, "mod_slug": filename, "mod_id": filename, "filename": filename,
+                 "hashes": {"sha1": hashlib.sha1(content).hexdigest()}, "source": "modrinth"}
+                for filename, content in contents.items()]
+        with open("mcmm.json", "w") as file:
+            json.dump({"server_version": "1.21", "mods": mods}, file)
+        mcmm.load_manifest()
+
+    def test_swapped_but_manifest_not_saved(self):
+        self.write_mods("mods", {"mod-2.jar": b"new"})
+        self.write_mods(mcmm.mods_backup_dir, {"mod-1.jar": b"old"})
+        self.load_manifest({"mod-1.jar": b"old"})
+
+        mcmm.recover_mods_folder()
+
+        self.assertEqual(os.listdir("mods"), ["mod-1.jar"])
+        self.assertEqual(os.listdir(mcmm.mods_staging_dir), ["mod-2.jar"])
+        self.assertFalse(os.path.exists(mcmm.mods_backup_dir))
+
+    def test_saved_but_backup_not_deleted(self):
+        self.write_mods("mods", {"mod-2.jar": b"new"})
+        self.write_mods(mcmm.mods_backup_dir, {"mod-1.jar": b"old"})
+        self.load_manifest({"mod-2.jar": b"new"})
+
+        mcmm.recover_mods_folder()
+
+        self.assertEqual(os.listdir("mods"), ["mod-2.jar"])
+        self.assertFalse(os.path.exists(mcmm.mods_backup_dir))
+
+    def test_mods_folder_missing(self):
+        self.write_mods(mcmm.mods_backup_dir, {"mod-1.jar": b"old"})
+        self.load_manifest({"mod-1.jar": b"old"})
+
+        mcmm.recover_mods_folder()
+
+        self.assertEqual(os.listdir("mods"), ["mod-1.jar"])
+        self.assertFalse(os.path.exists(mcmm.mods_backup_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
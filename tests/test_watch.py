@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mcmm
+
+jar = b"mod-1 1.0"
+versions = [{"id": "V1", "project_id": "P1", "game_versions": ["1.21"], "loaders": ["fabric"], "dependencies": [],
+             "files": [{"filename": "mod-1.jar", "url": "http://127.0.0.1/mod-1.jar", "size": len(jar),
+                        "hashes": {"sha1": hashlib.sha1(jar).hexdigest(),
+                                   "sha512": hashlib.sha512(jar).hexdigest()}}]}]
+
+
+class ModrinthHandler(BaseHTTPRequestHandler):
+    # Answers with an ETag on GET requests, like the real API, and records every request
+
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(("GET", self.path, self.headers.get("If-None-Match")))
+        if self.path.startswith("/tag/game_version"):
+            return self.send_json([{"version": "1.21"}])
+        if self.path.startswith("/project/mod-1/version"):
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            return self.send_json(versions, etag='"v1"')
+        self.send_json({}, status=404)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.requests.append(("POST", self.path, self.headers.get("If-None-Match")))
+        self.send_json({})
+
+    def send_json(self, data, status=200, etag=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WatchRevalidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ModrinthHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        ModrinthHandler.requests = []
+
+        self.original_dir = os.getcwd()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.temp_dir.name)
+        os.makedirs("mods")
+        with open(os.path.join("mods", "mod-1.jar"), "wb") as file:
+            file.write(jar)
+        with open("mcmm.json", "w") as file:
+            json.dump({"server_version": "1.21", "mods": [{
+                "mod_name": "Mod 1", "mod_slug": "mod-1", "mod_id": "P1", "mod_version_id": "V1",
+                "filename": "mod-1.jar", "download_url": "http://127.0.0.1/mod-1.jar",
+                "hashes": versions[0]["files"][0]["hashes"], "current_version": "1.21", "source": "modrinth"}]}, file)
+
+        self.patches = [
+            mock.patch.object(mcmm, "modrinth_api_url", f"http://127.0.0.1:{self.server.server_port}"),
+            mock.patch.object(mcmm, "cache_dir", os.path.join(self.temp_dir.name, "cache")),
+            mock.patch.object(mcmm, "cache_enabled", True),
+            mock.patch.object(mcmm, "cache_max_ttl", None),
+            mock.patch.object(mcmm, "game_versions", None),
+            mock.patch.object(mcmm, "hash_index", None),
+            mock.patch.object(mcmm, "watch_interval", 0.4),
+            mock.patch.object(mcmm, "watch_poll_interval", 0.05),
+        ]
+        for patch in self.patches:
+            patch.start()
+        mcmm.load_manifest()
+
+    def tearDown(self):
+        mcmm.manifest.unlock()
+        mcmm.manifest = None
+        for patch in reversed(self.patches):
+            patch.stop()
+        os.chdir(self.original_dir)
+        self.temp_dir.cleanup()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_second_check_revalidates(self):
+        # Stop watching once the mod has been checked twice, or after a few rounds if the
+        # second check doesn't reach the API
+        rounds = []
+
+        def stop_after_two_checks(*args):
+            rounds.append(args)
+            checks = [request for request in ModrinthHandler.requests if request[1].startswith("/project/")]
+            if len(checks) >= 2 or len(rounds) >= 5:
+                raise KeyboardInterrupt
+
+        with mock.patch.object(mcmm, "write_watch_status", side_effect=stop_after_two_checks):
+            mcmm.watch_updates("1.21")
+
+        checks = [request for request in ModrinthHandler.requests if request[0] == "POST" or
+                  request[1].startswith("/project/")]
+        self.assertEqual(len(checks), 2, checks)
+        self.assertEqual(checks[0][0], "GET")
+        self.assertIsNone(checks[0][2])
+        self.assertEqual(checks[1], ("GET", checks[0][1], '"v1"'))
+
+
+if __name__ == "__main__":
+    unittest.main()